@@ -0,0 +1,495 @@
+import io
+import os
+import re
+import sqlite3
+import argparse
+import threading
+from docx import Document
+from knowledge import CACHE_DIR, ExtractionCache, cached_parse, extract_pdf, table_rows
+from answer_cache import PROGRAM_ALIASES, find_programs
+from scoring import NOTE_2025
+from textnorm import normalize
+
+# --- BẢNG ĐIỂM CHUẨN / HỌC PHÍ / CHỈ TIÊU DẠNG CÓ CẤU TRÚC ---
+# Bảng trong diemchuan.pdf, file học phí và Phụ lục ngành đào tạo được tách thành bản ghi
+# (ngành, phương thức, tổ hợp, năm, điểm / học phí / chỉ tiêu) và nạp vào SQLite trong bộ nhớ.
+# Câu tra cứu đơn giản ("điểm chuẩn AI", "học phí APCS") được trả lời bằng 1 truy vấn
+# theo index thay vì gửi ngữ cảnh cho Gemini. Câu nào không chắc chắn thì trả None để Gemini xử lý.
+TABLE_FILES = {
+    "scores": "data/Điểm chuẩn/diemchuan.pdf",
+    "tuition": "data/Học phí/Học-phí-dự-kiên-tính-theo-năm-2025.docx",
+    "programs": "data/Phụ lục/Phu-luc-4.1.-NGANH-DAO-TAO-2025.docx",
+}
+# Bản ghi đã tách được cache theo sha256 của file nguồn, cạnh cache trích xuất của knowledge.py
+TABLES_CACHE_FILE = "tables_cache.json"
+# Tăng số này khi đổi cách tách bảng để cache cũ tự bị bỏ qua
+PARSER_VERSION = 1
+
+# Chỉ trả lời thông tin kì tuyển sinh 2025 (mục 5 và 11 của context_instruction);
+# bảng điểm chuẩn các năm trước vẫn được tách nhưng không dùng để trả lời
+ADMISSION_YEAR = 2025
+UNSUPPORTED_YEAR = ("Dạ, mình không hỗ trợ thông tin tuyển sinh {year}. Hiện mình chỉ có thông tin "
+                    f"của kì tuyển sinh năm {ADMISSION_YEAR}.")
+
+METHOD_NAMES = {
+    "1a": "Tuyển thẳng và ưu tiên xét tuyển theo quy định của Bộ GD-ĐT",
+    "1b": "Ưu tiên xét tuyển thẳng theo quy định của ĐHQG-HCM",
+    "1c": "Ưu tiên xét tuyển theo quy định của ĐHQG-HCM",
+    "1d": "Kết quả học tập THPT kết hợp chứng chỉ tiếng Anh quốc tế",
+    "2": "Điểm thi tốt nghiệp THPT",
+    "3": "Điểm thi ĐGNL của ĐHQG-HCM",
+}
+# Tổ hợp mới lấy điểm chuẩn theo tổ hợp cũ (ghi chú trong diemchuan.pdf)
+GROUP_ALIASES = {"X06": "A00", "X26": "A01"}
+GROUP_NOTE = "(Tổ hợp X06 lấy điểm chuẩn theo A00, X26 lấy điểm chuẩn theo A01)"
+
+SCHEMA = """
+CREATE TABLE program (
+    code TEXT PRIMARY KEY, name TEXT NOT NULL, major_code TEXT, quota INTEGER, quota_year INTEGER);
+CREATE TABLE cutoff_score (
+    program TEXT NOT NULL, year INTEGER NOT NULL, method TEXT NOT NULL,
+    subject_group TEXT, score REAL, note TEXT);
+CREATE INDEX ix_cutoff_score_lookup ON cutoff_score (program, year, method);
+CREATE TABLE tuition (
+    program TEXT NOT NULL, intake_year INTEGER, study_year INTEGER NOT NULL, fee INTEGER NOT NULL);
+CREATE INDEX ix_tuition_lookup ON tuition (program, intake_year);
+"""
+
+
+# --- TÁCH BẢNG ĐIỂM CHUẨN TỪ PDF ---
+# Bảng PDF ra dạng text: mỗi hàng "STT Tên ngành giá trị...", ô trống thành 2 dấu cách liền nhau.
+# Năm 2025: mỗi phương thức 1 bảng, cột là tổ hợp. Các năm trước: 1 bảng, cột là phương thức
+# và tiêu đề cột bị ngắt thành nhiều dòng.
+_YEAR_RE = re.compile(r"^[ivx]+\. diem chuan (\d{4})")
+_SECTION_RE = re.compile(r"^\d+\. .*?phuong thuc ([^(]+)")
+_METHOD_CODE_RE = re.compile(r"\b\d[a-d]?\b")
+_GROUP_RE = re.compile(r"\b[A-Z]\d{2}\b")
+_NUMBER_RE = re.compile(r"^\d+(?:[.,]\d+)?$")
+_COLUMN_RE = re.compile(r"uu tien xet tuyen thang|utxtt|uu tien xet tuyen|utxt|danh gia nang luc|dgnl|hoc ba \+ ielts|thpt")
+_COLUMN_METHODS = {
+    "uu tien xet tuyen thang": "1b", "utxtt": "1b", "uu tien xet tuyen": "1c", "utxt": "1c",
+    "danh gia nang luc": "3", "dgnl": "3", "hoc ba + ielts": "1d", "thpt": "2",
+}
+
+
+def split_row(line):
+    # "2 Trí tuệ nhân tạo 9.6 9.9 1032  27.6" -> ("Trí tuệ nhân tạo", ["9.6", "9.9", "1032", "", "27.6"])
+    parts = line.rstrip().split(" ")
+    if len(parts) < 2 or not parts[0].isdigit():
+        return None
+    i = 1
+    while i < len(parts) and parts[i] and not _NUMBER_RE.match(parts[i]):
+        i += 1
+    return " ".join(parts[1:i]), parts[i:]
+
+
+def parse_value(cell):
+    # -> (điểm, ghi chú); ô chữ như "8.0 IELTS, Học bạ 9.5" giữ nguyên ở ghi chú
+    cell = cell.strip()
+    if _NUMBER_RE.match(cell):
+        return float(cell.replace(",", ".")), None
+    return None, cell or None
+
+
+def parse_cutoff_scores(text):
+    # -> [(mã ngành, tên ngành, năm, phương thức, tổ hợp, điểm, ghi chú)]
+    records = []
+    year, methods, groups, header, columns = None, [], [], None, None
+    for line in text.splitlines():
+        norm = " ".join(normalize(line).split())
+        m = _YEAR_RE.match(norm)
+        if m:
+            year, methods, groups, header, columns = int(m.group(1)), [], [], None, None
+            continue
+        m = _SECTION_RE.match(norm)
+        if m:
+            methods, groups, header, columns = _METHOD_CODE_RE.findall(m.group(1)), [], None, None
+            continue
+        if norm.startswith("stt nganh"):
+            header, groups, columns = norm, _GROUP_RE.findall(line), None
+            continue
+        row = split_row(line)
+        if row is None or not any(_NUMBER_RE.match(c) for c in row[1]):
+            # Dòng tiêu đề bị ngắt, ghi chú, hoặc hàng không có điểm (phương thức 1a)
+            if header is not None and columns is None:
+                header += " " + norm
+                groups += _GROUP_RE.findall(line)
+            continue
+        if year is None:
+            continue
+        if columns is None:
+            if methods:
+                columns = [(method, g) for method in methods for g in (groups or [None])]
+            else:
+                columns = [(_COLUMN_METHODS[c], None) for c in _COLUMN_RE.findall(header or "")]
+        if not columns:
+            continue
+        name, cells = row
+        codes = find_programs(name)
+        if not codes:
+            continue
+        width = len(groups) if methods and groups else (1 if methods else len(columns))
+        values = cells[:width - 1] + [" ".join(cells[width - 1:])]
+        values += [""] * (width - len(values))
+        for i, (method, group) in enumerate(columns):
+            score, note = parse_value(values[i % width])
+            if score is not None or note:
+                records.append((codes[0], name, year, method, group, score, note))
+    return records
+
+
+# --- TÁCH BẢNG HỌC PHÍ / NGÀNH ĐÀO TẠO TỪ DOCX ---
+_INTAKE_RE = re.compile(r"khoa tuyen (\d{4})")
+_STUDY_YEAR_RE = re.compile(r"^nam (\d)$")
+_FEE_LINE_RE = re.compile(r"^nam (\d): ([\d.]+)")
+_HEADING_RE = re.compile(r"^\d+\. (.+)")
+
+
+def parse_fee(text):
+    digits = re.sub(r"\D", "", text)
+    return int(digits) if digits else None
+
+
+def parse_tuition(doc):
+    # -> (khóa tuyển, [(mã ngành, tên ngành, năm học, học phí)])
+    # Bảng là nguồn chính; các dòng "Năm k: ..." bên dưới chỉ bổ sung ngành không có trong bảng
+    intake = None
+    for para in doc.paragraphs:
+        m = _INTAKE_RE.search(normalize(para.text))
+        if m:
+            intake = int(m.group(1))
+            break
+
+    records = []
+    for table in doc.tables:
+        study_years = {}
+        for cells in table_rows(table):
+            matches = [(i, _STUDY_YEAR_RE.match(normalize(c))) for i, c in enumerate(cells)]
+            header = {i: int(m.group(1)) for i, m in matches if m}
+            if header:
+                study_years = header
+                continue
+            codes = find_programs(" ".join(cells))
+            if not study_years or not codes:
+                continue
+            name = next(c for c in cells if find_programs(c))
+            for i, study_year in study_years.items():
+                fee = parse_fee(cells[i]) if i < len(cells) else None
+                if fee:
+                    records.append((codes[0], name, study_year, fee))
+
+    from_table = {r[0] for r in records}
+    code = name = None
+    for para in doc.paragraphs:
+        text = para.text.strip()
+        heading = _HEADING_RE.match(text)
+        if heading:
+            codes = find_programs(heading.group(1))
+            code, name = (codes[0], heading.group(1)) if codes else (None, None)
+            continue
+        fee_line = _FEE_LINE_RE.match(normalize(text))
+        if fee_line and code and code not in from_table:
+            records.append((code, name, int(fee_line.group(1)), parse_fee(fee_line.group(2))))
+    return intake, records
+
+
+def parse_programs(doc):
+    # -> [(mã ngành, tên ngành, mã ngành của Bộ, chỉ tiêu, năm)] từ bảng "Mã Ngành | Tên Ngành | Tổng Chỉ Tiêu năm ..."
+    records = []
+    for table in doc.tables:
+        columns = None
+        for cells in table_rows(table):
+            norm = [normalize(c) for c in cells]
+            if columns is None:
+                if any("ma nganh" in c for c in norm) and any("chi tieu" in c for c in norm):
+                    year = re.search(r"\d{4}", " ".join(norm))
+                    columns = (next(i for i, c in enumerate(norm) if "ma nganh" in c),
+                               next(i for i, c in enumerate(norm) if "ten nganh" in c),
+                               next(i for i, c in enumerate(norm) if "chi tieu" in c),
+                               int(year.group(0)) if year else None)
+                continue
+            code_col, name_col, quota_col, year = columns
+            if max(code_col, name_col, quota_col) >= len(cells):
+                continue
+            codes = find_programs(cells[name_col])
+            if codes:
+                records.append((codes[0], cells[name_col], cells[code_col], parse_fee(cells[quota_col]), year))
+    return records
+
+
+# --- NHẬN DIỆN CÂU TRA CỨU TRONG CHAT ---
+_TOPICS = {"diem chuan": "scores", "hoc phi": "tuition", "ma nganh": "major_code", "chi tieu": "quota"}
+# Câu có các từ này cần suy luận/so sánh/dự đoán -> để Gemini trả lời
+_COMPLEX_CUES = (
+    "so sanh", "tai sao", "vi sao", "khi nao", "co dau", "dau khong", "kha nang", "du doan", "nam sau",
+    "nam toi", "nam nay", "tang len", "giam xuong", "co tang", "co giam", "hoc bong", "mien giam",
+    "tong cong", "tong hoc phi", "trung binh", "chenh lech", "nganh nao", "cao nhat", "thap nhat",
+    "thay doi", "bien dong",
+)
+_CUE_RE = re.compile(r"\b(?:" + "|".join(_COMPLEX_CUES) + r")\b")
+_ALL_PROGRAMS_RE = re.compile(r"\b(?:cac nganh|tat ca|moi nganh)\b")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_Q_YEAR_RE = re.compile(r"\b(20\d{2})\b")
+# "năm ngoái", "các năm trước"... cũng là năm khác 2025 ("năm sau", "năm nay" đã nằm trong _COMPLEX_CUES)
+_RELATIVE_YEARS = {
+    "nam ngoai": "năm ngoái", "nam truoc": "năm trước", "nam kia": "năm kia", "nam roi": "năm rồi",
+    "nam vua roi": "năm vừa rồi", "nam vua qua": "năm vừa qua",
+}
+_Q_RELATIVE_YEAR_RE = re.compile(r"\b(?:(?:cac|nhung|may) nam (?:truoc|gan day|qua)|"
+                                 + "|".join(_RELATIVE_YEARS) + r")\b")
+_Q_STUDY_YEAR_RE = re.compile(r"\bnam (?:thu )?([1-4])\b")
+_Q_METHOD_RE = re.compile(r"\b(?:phuong thuc|pt|ptxt) ?(1a|1b|1c|1d|1|2|3)\b")
+_Q_METHOD_KEYWORDS = (
+    ("1b", r"uu tien xet tuyen thang|utxtt"), ("1c", r"uu tien xet tuyen|utxt"),
+    ("1d", r"ielts|hoc ba"), ("3", r"dgnl|danh gia nang luc"), ("2", r"thpt|thi tot nghiep"),
+)
+_Q_GROUP_RE = re.compile(r"\b([abdx]\d{2})\b")
+
+
+def parse_lookup_question(question):
+    # Trả về dict điều kiện tra cứu nếu câu hỏi là tra cứu đơn giản, ngược lại None
+    text = " ".join(_PUNCT_RE.sub(" ", normalize(question)).split())
+    topics = [kind for topic, kind in _TOPICS.items() if topic in text]
+    if len(topics) != 1 or _CUE_RE.search(text):
+        return None
+    # Tìm ngành trên câu gốc: "AI" viết hoa là tên ngành, "ai" thường là đại từ
+    programs = find_programs(question)
+    if not programs:
+        if not _ALL_PROGRAMS_RE.search(text):
+            return None
+        programs = list(PROGRAM_ALIASES)
+
+    lookup = {"kind": topics[0], "programs": programs, "year": None, "study_year": None,
+              "method": None, "group": None}
+    rest = text
+    years = _Q_YEAR_RE.findall(text)
+    relative = _Q_RELATIVE_YEAR_RE.findall(text)
+    if len(years) + len(relative) > 1:
+        return None
+    if years:
+        lookup["year"] = int(years[0])
+        rest = _Q_YEAR_RE.sub(" ", rest)
+    elif relative:
+        # Năm tương đối: giữ nguyên cách nói để trả lời "không hỗ trợ thông tin tuyển sinh năm ngoái"
+        lookup["year"] = _RELATIVE_YEARS.get(relative[0], "các năm trước")
+        rest = _Q_RELATIVE_YEAR_RE.sub(" ", rest)
+    m = _Q_STUDY_YEAR_RE.search(rest)
+    if m and topics[0] == "tuition":
+        lookup["study_year"] = int(m.group(1))
+        rest = _Q_STUDY_YEAR_RE.sub(" ", rest)
+    m = _Q_METHOD_RE.search(rest)
+    if m:
+        # "phương thức 1" gồm cả 1a-1d -> không lọc
+        lookup["method"] = m.group(1) if m.group(1) != "1" else None
+        rest = _Q_METHOD_RE.sub(" ", rest)
+    else:
+        lookup["method"] = next((code for code, pattern in _Q_METHOD_KEYWORDS if re.search(pattern, rest)), None)
+    m = _Q_GROUP_RE.search(rest)
+    if m:
+        group = m.group(1).upper()
+        lookup["group"] = GROUP_ALIASES.get(group, group)
+        rest = _Q_GROUP_RE.sub(" ", rest)
+    # Còn số khác (điểm của thí sinh, khoảng năm...) -> không phải câu tra cứu đơn giản
+    if re.search(r"\d", rest):
+        return None
+    return lookup
+
+
+def format_fee(fee):
+    return f"{fee:,}".replace(",", ".")
+
+
+def format_score(score, note):
+    return f"**{score:g}**" if score is not None else note
+
+
+def parse_scores_file(data):
+    return parse_cutoff_scores(extract_pdf(data))
+
+
+def parse_tuition_file(data):
+    return parse_tuition(Document(io.BytesIO(data)))
+
+
+def parse_programs_file(data):
+    return parse_programs(Document(io.BytesIO(data)))
+
+
+PARSERS = {"scores": parse_scores_file, "tuition": parse_tuition_file, "programs": parse_programs_file}
+
+
+class AdmissionTables:
+    def __init__(self, files=TABLE_FILES, cache_dir=CACHE_DIR):
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.intake_year = None
+        cache = ExtractionCache(cache_dir, TABLES_CACHE_FILE, PARSER_VERSION)
+        loaders = {"scores": self._load_scores, "tuition": self._load_tuition, "programs": self._load_programs}
+        for kind, path in files.items():
+            if not os.path.exists(path):
+                continue
+            try:
+                loaders[kind](cached_parse(cache, path, PARSERS[kind]))
+            except Exception as e:
+                print(f"   ❌ LỖI tách bảng {path}: {e}")
+        cache.save()
+        self.db.commit()
+        print(f"   📊 Bảng tuyển sinh: {self.count('cutoff_score')} điểm chuẩn, "
+              f"{self.count('tuition')} học phí, {self.count('program')} ngành")
+
+    # --- NẠP DỮ LIỆU ---
+    def _add_program(self, code, name):
+        # Tên hiển thị lấy từ nguồn đầu tiên nhắc tới ngành (điểm chuẩn -> học phí -> phụ lục)
+        self.db.execute("INSERT OR IGNORE INTO program (code, name) VALUES (?, ?)", (code, name))
+
+    def _load_scores(self, records):
+        for code, name, *_ in records:
+            self._add_program(code, name)
+        self.db.executemany("INSERT INTO cutoff_score VALUES (?, ?, ?, ?, ?, ?)",
+                            [(code, *rest) for code, name, *rest in records])
+
+    def _load_tuition(self, parsed):
+        self.intake_year, records = parsed
+        for code, name, *_ in records:
+            self._add_program(code, name)
+        self.db.executemany("INSERT INTO tuition VALUES (?, ?, ?, ?)",
+                            [(code, self.intake_year, study_year, fee) for code, name, study_year, fee in records])
+
+    def _load_programs(self, records):
+        for code, name, major_code, quota, year in records:
+            self._add_program(code, name)
+            self.db.execute("UPDATE program SET major_code = ?, quota = ?, quota_year = ? WHERE code = ?",
+                            (major_code, quota, year, code))
+
+    # --- TRA CỨU ---
+    def query(self, sql, params=()):
+        with self._lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def count(self, table):
+        return self.query(f"SELECT COUNT(*) FROM {table}")[0][0]
+
+    def program_names(self, codes):
+        placeholders = ",".join("?" * len(codes))
+        rows = dict(self.query(f"SELECT code, name FROM program WHERE code IN ({placeholders})", codes))
+        return [(code, rows[code]) for code in codes if code in rows]
+
+    def cutoff_scores(self, program, year, method=None, group=None):
+        sql = "SELECT method, subject_group, score, note FROM cutoff_score WHERE program = ? AND year = ?"
+        params = [program, year]
+        if method:
+            sql += " AND method = ?"
+            params.append(method)
+        if group:
+            sql += " AND subject_group = ?"
+            params.append(group)
+        return self.query(sql + " ORDER BY method, rowid", params)
+
+    def answer(self, question):
+        # Câu trả lời markdown, hoặc None nếu câu hỏi không phải tra cứu đơn giản / không có dữ liệu
+        lookup = parse_lookup_question(question)
+        if lookup is None:
+            return None
+        year = lookup["year"]
+        if year not in (None, ADMISSION_YEAR):
+            return UNSUPPORTED_YEAR.format(year=year if isinstance(year, str) else f"năm {year}")
+        programs = self.program_names(lookup["programs"])
+        if not programs:
+            return None
+        formatter = {"scores": self._answer_scores, "tuition": self._answer_tuition,
+                     "major_code": self._answer_programs, "quota": self._answer_programs}[lookup["kind"]]
+        lines = formatter(lookup, programs)
+        if not lines:
+            return None
+        return "\n".join(lines + ["", NOTE_2025])
+
+    def _answer_scores(self, lookup, programs):
+        year = ADMISSION_YEAR
+        lines, has_groups = [], False
+        for code, name in programs:
+            rows = self.cutoff_scores(code, year, lookup["method"], lookup["group"])
+            if not rows:
+                continue
+            # Gộp các phương thức liên tiếp có cùng điểm (vd 1b, 1c năm 2025)
+            by_method = []
+            for method, group, score, note in rows:
+                if not by_method or by_method[-1][0][-1] != method:
+                    by_method.append(([method], []))
+                by_method[-1][1].append((group, score, note))
+            merged = []
+            for methods, cells in by_method:
+                if merged and merged[-1][1] == cells:
+                    merged[-1][0].extend(methods)
+                else:
+                    merged.append((methods, cells))
+            lines += ["", f"**{name}**:", ""]
+            for methods, cells in merged:
+                label = ", ".join(methods)
+                names = "; ".join(METHOD_NAMES[m] for m in methods)
+                values = ", ".join(f"{group} {format_score(score, note)}" if group else format_score(score, note)
+                                   for group, score, note in cells)
+                has_groups = has_groups or any(group for group, _, _ in cells)
+                lines.append(f"- Phương thức {label} ({names}): {values}")
+        if not lines:
+            return None
+        if has_groups:
+            lines += ["", GROUP_NOTE]
+        return [f"Dạ, điểm chuẩn năm {year} của Khoa Công nghệ Thông tin:"] + lines
+
+    def _answer_tuition(self, lookup, programs):
+        if lookup["year"] and lookup["year"] != self.intake_year:
+            return None
+        lines = []
+        for code, name in programs:
+            sql = "SELECT study_year, fee FROM tuition WHERE program = ? AND intake_year IS ?"
+            params = [code, self.intake_year]
+            if lookup["study_year"]:
+                sql += " AND study_year = ?"
+                params.append(lookup["study_year"])
+            rows = self.query(sql + " ORDER BY study_year", params)
+            if rows:
+                lines += ["", f"**{name}**:", ""]
+                lines += [f"- Năm {study_year}: **{format_fee(fee)}** đồng" for study_year, fee in rows]
+        if not lines:
+            return None
+        intake = f" Khóa tuyển {self.intake_year}" if self.intake_year else ""
+        return [f"Dạ, học phí dự kiến{intake} (đơn vị: đồng/năm học):"] + lines
+
+    def _answer_programs(self, lookup, programs):
+        column = "major_code" if lookup["kind"] == "major_code" else "quota"
+        lines, years = [], set()
+        for code, name in programs:
+            value, quota_year = self.query(f"SELECT {column}, quota_year FROM program WHERE code = ?", (code,))[0]
+            if value is None or (column == "quota" and lookup["year"] not in (None, quota_year)):
+                continue
+            lines.append(f"- **{name}**: **{value}**")
+            years.add(quota_year)
+        if not lines:
+            return None
+        if column == "major_code":
+            return ["Dạ, mã ngành đào tạo:", ""] + lines
+        year = f" năm {years.pop()}" if len(years) == 1 and None not in years else ""
+        return [f"Dạ, tổng chỉ tiêu{year}:", ""] + lines
+
+
+# --- CLI: xem các bản ghi đã tách và thử câu hỏi ---
+# python admission_tables.py ["Điểm chuẩn ngành AI?" ...]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tách bảng điểm chuẩn/học phí và thử tra cứu")
+    parser.add_argument("questions", nargs="*")
+    args = parser.parse_args(argv)
+
+    tables = AdmissionTables()
+    if not args.questions:
+        for table in ("program", "cutoff_score", "tuition"):
+            print(f"--- {table} ---")
+            for row in tables.query(f"SELECT * FROM {table}"):
+                print("   ", row)
+    for question in args.questions:
+        print(f">>> {question}")
+        print(tables.answer(question) or "(không tra cứu được, chuyển cho Gemini)")
+
+
+if __name__ == "__main__":
+    main()
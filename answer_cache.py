@@ -0,0 +1,201 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from textnorm import normalize
+
+# --- CACHE CÂU TRẢ LỜI CHO CÂU HỎI LẶP LẠI ---
+# Phần lớn lượt hỏi là cùng vài chục câu (điểm chuẩn, học phí...) viết theo nhiều cách:
+# có dấu/không dấu, hoa/thường, tên gọi khác của ngành ("APCS", "cttt", "CLC"...).
+# Câu hỏi được chuẩn hóa về một khóa chung; khóa gắn với hash KNOWLEDGE_BASE nên dữ liệu
+# đổi là cache cũ tự mất hiệu lực.
+TTL = int(os.environ.get("ANSWER_CACHE_TTL", 6 * 3600))
+MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_SIZE", 1000))
+REDIS_URL = os.environ.get("REDIS_URL")
+
+# Tên gọi khác của các ngành (mục 6 trong context_instruction), đã bỏ dấu
+PROGRAM_ALIASES = {
+    "apcs": [
+        "khoa hoc may tinh chuong trinh tien tien", "advanced program in computer science",
+        "apcs", "khmt tien tien", "cttt", "chuong trinh tien tien", "tien tien",
+    ],
+    # "ai" đứng một mình là đại từ ("do ai quyết định"); chữ "AI" viết hoa được đổi trước khi bỏ dấu
+    "ai": ["tri tue nhan tao", "ttnt", "nganh ai"],
+    "tcta": [
+        "cong nghe thong tin chuong trinh tang cuong tieng anh",
+        "cong nghe thong tin chuong trinh chat luong cao", "cntt clc", "clc", "tcta", "dkd",
+        "tang cuong tieng anh", "chat luong cao",
+    ],
+    "daitra": [
+        "nhom nganh may tinh va cong nghe thong tin", "nhom nganh mt va cntt", "cntt dai tra",
+        "dai tra", "nhom nganh", "cq",
+    ],
+    "cntn": ["chuong trinh cu nhan tai nang", "cu nhan tai nang", "cntn"],
+}
+
+_ALIAS_LOOKUP = {alias: code for code, aliases in PROGRAM_ALIASES.items() for alias in aliases}
+# Ghép tên dài trước để "khmt tien tien" không bị thay thành "khmt <apcs>"
+_ALIAS_RE = re.compile(r"\b(" + "|".join(
+    re.escape(a) for a in sorted(_ALIAS_LOOKUP, key=len, reverse=True)) + r")\b")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_AI_UPPER_RE = re.compile(r"(?<!\w)AI(?!\w)")
+# Từ đệm lịch sự không đổi nghĩa câu hỏi
+_FILLERS = {"nganh", "a", "ah", "ha", "nhe", "nha", "oi", "voi", "di", "the", "vay", "z", "ad", "admin", "cho", "em", "minh", "hoi"}
+# Dấu hiệu câu hỏi nối tiếp, phụ thuộc ngữ cảnh trước đó
+_FOLLOW_UP = {"con", "nganh do", "nganh nay", "no", "thi sao", "cai do", "o tren", "vua roi", "nhu vay"}
+_TOPICS = ("hoc phi", "diem chuan", "chi tieu", "ma nganh", "to hop", "diem cong", "phuong thuc")
+
+
+def _normalize(text):
+    # Bỏ dấu + dấu câu; "AI" viết hoa trong câu gốc là tên ngành
+    text = _AI_UPPER_RE.sub("tri tue nhan tao", text)
+    return " ".join(_PUNCT_RE.sub(" ", normalize(text)).split())
+
+
+def normalize_question(question):
+    text = _normalize(question)
+    text = _ALIAS_RE.sub(lambda m: f"<{_ALIAS_LOOKUP[m.group(1)]}>", text)
+    return " ".join(w for w in text.split() if w not in _FILLERS)
+
+
+def find_programs(text):
+    # Mã các ngành được nhắc tới trong câu, theo thứ tự xuất hiện, không trùng
+    text = _normalize(text)
+    codes = []
+    for m in _ALIAS_RE.finditer(text):
+        code = _ALIAS_LOOKUP[m.group(1)]
+        if code not in codes:
+            codes.append(code)
+    return codes
+
+
+def is_context_free(question):
+    # Câu hỏi tự đủ nghĩa: nêu rõ ngành + chủ đề, không tham chiếu tới câu trước
+    text = " " + _normalize(question) + " "
+    if any(f" {marker} " in text for marker in _FOLLOW_UP):
+        return False
+    return bool(_ALIAS_RE.search(text)) and any(topic in text for topic in _TOPICS)
+
+
+class LocalBackend:
+    # LRU + TTL trong bộ nhớ của từng worker
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    # Dùng chung giữa các worker/instance khi có REDIS_URL
+    def __init__(self, url, ttl=TTL):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.ttl = ttl
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value):
+        self.client.setex(key, self.ttl, value)
+
+    def clear(self):
+        # Khóa đã gắn hash dữ liệu, khóa cũ tự hết hạn theo TTL
+        pass
+
+    def __len__(self):
+        return 0
+
+
+def make_backend():
+    if REDIS_URL:
+        try:
+            return RedisBackend(REDIS_URL)
+        except ImportError:
+            print(">>> Chưa cài redis, dùng cache câu trả lời trong bộ nhớ")
+    return LocalBackend()
+
+
+class AnswerCache:
+    def __init__(self, knowledge_hash, backend=None):
+        self.backend = backend or make_backend()
+        self.knowledge_hash = knowledge_hash
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def set_knowledge_hash(self, knowledge_hash):
+        if knowledge_hash != self.knowledge_hash:
+            self.knowledge_hash = knowledge_hash
+            self.backend.clear()
+
+    def key_for(self, question, knowledge_hash=None):
+        # knowledge_hash: hash của snapshot dữ liệu mà request đang dùng (mặc định: hash hiện tại)
+        digest = hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()
+        # v2: giá trị là markdown gốc (trước đây là HTML đã render)
+        return f"answer:v2:{knowledge_hash or self.knowledge_hash}:{digest}"
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # Cache lỗi thì coi như miss, không làm hỏng lượt chat
+            self.errors += 1
+            print(f"Lỗi cache câu trả lời: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            self.errors += 1
+            print(f"Lỗi cache câu trả lời: {e}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self.backend),
+            "evictions": self.backend.evictions,
+        }
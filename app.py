@@ -1,14 +1,29 @@
 import os
-from flask import Flask, render_template, request, jsonify
+import json
+import time
+import base64
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import google.generativeai as genai
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin, LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash 
 from datetime import datetime
-from docx import Document
-from pypdf import PdfReader
-import markdown
 from flask_cors import CORS
+from collections import namedtuple
+from contextlib import contextmanager
+from knowledge import read_data_recursive, knowledge_hash
+from knowledge_reload import KnowledgeReloader
+from retrieval import RetrievalIndex
+from upstream import UpstreamLimiter, UpstreamBusy, GeminiClient
+from answer_cache import AnswerCache, is_context_free
+from history import HistoryManager
+from message_store import RenderCache, render_markdown, message_fields
+from migrations import run_migrations
+from context_cache import ContextCacheManager
+from scoring import ScoreEngine, ScoringError, parse_score_question, format_score_reply
+from admission_tables import AdmissionTables
+import metrics
+from metrics import span, record_span, record_usage, record_upstream_error, failed_stage
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {
@@ -34,6 +49,16 @@ if database_url:
     if database_url.startswith("postgres://"):
         database_url = database_url.replace("postgres://", "postgresql://", 1)
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    if database_url.startswith("postgresql"):
+        # Pool connection cho Postgres managed: mỗi worker giữ tối đa pool_size + max_overflow
+        # connection. pre_ping bỏ connection đã bị server đóng, recycle trước khi proxy cắt.
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+            "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+            "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+            "pool_pre_ping": True,
+        }
     print(">>> Đang sử dụng PostgreSQL (Online)")
 else:
     # Nếu không tìm thấy (tức là đang chạy trên máy tính), dùng SQLite
@@ -50,68 +75,41 @@ login_manager.login_view = 'login' # Không dùng route này nhưng cần khai b
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Flask-Login tự nhớ user đã nạp trong request (g._login_user), hàm này chỉ chạy 1 lần/request
+    return db.session.get(User, int(user_id))
 # --- 2. CẤU HÌNH AI GEMINI ---
 # ⚠️ QUAN TRỌNG: Thay API Key MỚI của bạn vào đây
 MY_API_KEY = os.environ.get("GOOGLE_API_KEY")
-genai.configure(api_key=MY_API_KEY)
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+        return monkey.is_module_patched("socket")
+    except ImportError:
+        return False
+
+# gRPC không chạy cooperative dưới gevent, nên khi chạy worker gevent thì gọi Gemini qua REST.
+# GEMINI_API_ENDPOINT dùng để trỏ sang server Gemini giả khi load-test.
+GEMINI_TRANSPORT = os.environ.get("GEMINI_TRANSPORT") or ("rest" if _gevent_patched() else None)
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")
+genai.configure(
+    api_key=MY_API_KEY,
+    transport=GEMINI_TRANSPORT,
+    client_options={"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None,
+)
 
 # Dùng model chuẩn 2.5-flash
-model = genai.GenerativeModel('gemini-2.5-flash')
-
-# Đọc dữ liệu
-def read_data_recursive(path):
-    combined_text = ""
-    if not os.path.exists(path):
-        return ""
-
-    items = os.listdir(path)
-
-    for item in items:
-        full_path = os.path.join(path, item)
-        
-        # 1. Nếu là Folder
-        if os.path.isdir(full_path):
-            print(f"📂 Đang vào folder: {item}...")
-            combined_text += read_data_recursive(full_path)
-        # 2. Nếu là File
-        elif os.path.isfile(full_path):
-            # --- KIỂM TRA ĐUÔI FILE ---
-            filename_lower = item.lower()
-            if filename_lower.endswith('.docx'):
-                try:
-                    doc = Document(full_path)
-                    text = "\n".join([para.text for para in doc.paragraphs if para.text.strip() != ''])
-                    combined_text += f"\n[Nguồn: File Word {item}]\n{text}\n"
-                    print(f"   ✅ Đã đọc file Word: {item}")
-                except Exception as e:
-                    print(f"   ❌ LỖI đọc file Word {item}: {e}")
-            elif filename_lower.endswith('.doc'):
-                print(f"   ⚠️ BỎ QUA file .doc (Hãy đổi sang .docx): {item}")
-            elif filename_lower.endswith('.pdf'):
-                try:
-                    reader = PdfReader(full_path)
-                    text = ""
-                    for page in reader.pages:
-                        extracted = page.extract_text()
-                        if extracted: text += extracted + "\n"
-                    combined_text += f"\n[Nguồn: File PDF {item}]\n{text}\n"
-                    print(f"   ✅ Đã đọc file PDF: {item}")
-                except Exception as e:
-                    print(f"   ❌ LỖI đọc file PDF {item}: {e}")
-            else:
-                pass
-    return combined_text
-
-print("--- BẮT ĐẦU QUÉT DỮ LIỆU ---")
-KNOWLEDGE_BASE = read_data_recursive('data')
-print(f"--- HOÀN TẤT! Tổng độ dài dữ liệu: {len(KNOWLEDGE_BASE)} ký tự ---")
-
-context_instruction = f"""
+MODEL_NAME = 'gemini-2.5-flash'
+upstream_limiter = UpstreamLimiter()
+# Mọi lời gọi Gemini đi qua đây: slot của limiter, timeout, thử lại, ngắt mạch, gộp câu hỏi trùng
+gemini_client = GeminiClient(upstream_limiter)
+
+def build_context_instruction(knowledge):
+    return f"""
 Bạn là Trợ lý ảo tư vấn tuyển sinh Khoa CNTT - ĐH KHTN ĐHQG-HCM.
 Dưới đây là DỮ LIỆU NỘI BỘ của trường:
 ----------------
-{KNOWLEDGE_BASE}
+{knowledge}
 ----------------
 
 CHỈ THỊ XỬ LÝ QUAN TRỌNG (ĐẶC BIỆT LƯU Ý PHẦN TÍNH TOÁN):
@@ -213,6 +211,58 @@ VÍ DỤ TƯ DUY ĐÚNG (Chain of Thought):
     - Phải luôn trả lời câu hỏi thông tin một cách tự nhiên. Đặc biệt các câu hỏi như điểm chuẩn thì phải giữ định dạng trả lời tự nhiên, không nên copy y hệt nội dung từ PDF (TẤT NHIÊN ĐIỂM SỐ VÀ THÔNG TIN PHẢI TUYỆT ĐỐI CHÍNH XÁC, KHÔNG ĐƯỢC NHẦM LẪN, KHÔNG ĐƯỢC HALLUCINATE)
 """
 
+# --- CHẾ ĐỘ NGỮ CẢNH ---
+# "retrieval": chỉ gửi các đoạn dữ liệu liên quan tới câu hỏi (mặc định)
+# "full": gửi toàn bộ dữ liệu như trước
+KNOWLEDGE_MODE = os.environ.get("KNOWLEDGE_MODE", "retrieval")
+RETRIEVAL_NOTE = "(Dữ liệu liên quan tới câu hỏi được gửi kèm ở đầu cuộc trò chuyện, mục \"DỮ LIỆU NỘI BỘ LIÊN QUAN\".)"
+# --- DỮ LIỆU TUYỂN SINH (NẠP LẠI ĐƯỢC KHI ĐANG CHẠY) ---
+# Mọi thứ dẫn xuất từ data/ nằm trong 1 snapshot. Mỗi request lấy snapshot 1 lần ở đầu
+# (current_knowledge) và dùng nó tới hết, kể cả khi dữ liệu được nạp lại giữa chừng.
+#   context_instruction: phần chỉ thị cố định -> system_instruction / context cache
+#   tables: bảng điểm chuẩn / học phí / chỉ tiêu đã tách thành bản ghi (tra cứu không qua Gemini)
+KnowledgeState = namedtuple("KnowledgeState", ["knowledge_hash", "context_instruction", "retrieval_index", "score_engine", "tables"])
+
+def build_knowledge_state():
+    print("--- BẮT ĐẦU QUÉT DỮ LIỆU ---")
+    knowledge = read_data_recursive('data')
+    khash = knowledge_hash(knowledge)
+    print(f"--- HOÀN TẤT! Tổng độ dài dữ liệu: {len(knowledge)} ký tự (hash {khash}) ---")
+    return KnowledgeState(
+        knowledge_hash=khash,
+        context_instruction=build_context_instruction(knowledge if KNOWLEDGE_MODE == "full" else RETRIEVAL_NOTE),
+        retrieval_index=RetrievalIndex.build(knowledge) if KNOWLEDGE_MODE == "retrieval" else None,
+        score_engine=ScoreEngine(),
+        tables=AdmissionTables(),
+    )
+
+knowledge_reloader = KnowledgeReloader(build_knowledge_state)
+# Tạo/tìm context cache cũng chiếm slot của limiter và tính vào ngắt mạch như lời gọi chat
+context_cache = ContextCacheManager(MODEL_NAME, limiter=upstream_limiter, breaker=gemini_client.breaker)
+answer_cache = AnswerCache(knowledge_reloader.state.knowledge_hash)
+history_manager = HistoryManager()
+render_cache = RenderCache()
+
+def current_knowledge():
+    kb = knowledge_reloader.state
+    # Dữ liệu đổi thì các câu trả lời đã cache (theo hash cũ) không còn dùng được
+    answer_cache.set_knowledge_hash(kb.knowledge_hash)
+    return kb
+
+def get_turn_context(kb, user_question, history):
+    # Phần ngữ cảnh thay đổi theo từng lượt: dữ liệu tìm được + bản ghi rút gọn các lượt cũ
+    sections = []
+    retrieval_index = kb.retrieval_index
+    if retrieval_index is not None:
+        # Ghép thêm câu hỏi trước đó để các câu hỏi nối tiếp ("còn ngành AI thì sao?") vẫn tìm đúng
+        previous = [text for role, text in history.recent if role == 'user'][-1:]
+        query = " ".join(previous + [user_question])
+        sections.append(f"DỮ LIỆU NỘI BỘ LIÊN QUAN:\n----------------\n{retrieval_index.context_for(query)}\n----------------")
+    if history.digest:
+        sections.append("CÁC LƯỢT TRAO ĐỔI TRƯỚC ĐÓ VỚI NGƯỜI DÙNG (BẢN GHI RÚT GỌN, KHÔNG ĐẦY ĐỦ):\n"
+                        f"{history.digest}")
+    return "\n\n".join(sections)
+
 
 
 # --- 3. MODELS (CẬP NHẬT CẤU TRÚC MỚI) ---
@@ -228,14 +278,21 @@ class Conversation(db.Model):
     title = db.Column(db.String(100), default="Cuộc trò chuyện mới")
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    __table_args__ = (db.Index('ix_conversation_user_timestamp', 'user_id', 'timestamp'),)
+    # Tóm tắt các lượt cũ (history.py) và id tin nhắn cuối cùng đã được tóm tắt
+    summary = db.Column(db.Text)
+    summarized_until = db.Column(db.Integer)
     messages = db.relationship('ChatMessage', backref='conversation', lazy=True, cascade="all, delete-orphan")
 
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    content = db.Column(db.Text, nullable=False)
+    content = db.Column(db.Text, nullable=False)  # rỗng nếu nội dung được nén vào packed
     role = db.Column(db.String(10), nullable=False) # 'user' hoặc 'bot'
+    format = db.Column(db.String(10))  # 'text' | 'md' | 'html' (tin cũ), xem message_store
+    packed = db.Column(db.LargeBinary)  # nội dung nén zlib (tin dài)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
+    __table_args__ = (db.Index('ix_chat_message_conversation_timestamp', 'conversation_id', 'timestamp'),)
 
 
 
@@ -260,8 +317,11 @@ def register():
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.json
-    user = User.query.filter_by(username=data['username']).first()
-    if user and check_password_hash(user.password, data['password']):
+    with span("db"):
+        user = User.query.filter_by(username=data['username']).first()
+    with span("password"):
+        valid = user is not None and check_password_hash(user.password, data['password'])
+    if valid:
         login_user(user)
         return jsonify({"success": True})
     return jsonify({"success": False, "message": "Sai tên đăng nhập hoặc mật khẩu"})
@@ -282,12 +342,57 @@ def check_auth():
 
 # --- CONVERSATION APIs (MỚI) ---
 
+# Phân trang kiểu keyset: cursor là (timestamp, id) của dòng cuối trang trước, mã hóa base64.
+# Truyền ?limit=N (và ?cursor=...) để nhận {"items": [...], "next_cursor": ...};
+# không có limit thì trả cả danh sách như cũ.
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(row):
+    raw = json.dumps([row.timestamp.isoformat() if row.timestamp else None, row.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return (datetime.fromisoformat(timestamp) if timestamp else None), int(row_id)
+
+def page_args():
+    # Trả về (limit, cursor) hoặc (None, None) nếu không phân trang
+    limit = request.args.get('limit', type=int)
+    if not limit:
+        return None, None
+    cursor = request.args.get('cursor')
+    return min(max(limit, 1), MAX_PAGE_SIZE), (decode_cursor(cursor) if cursor else None)
+
+def keyset_page(query, model, limit, cursor):
+    # Mới nhất trước: (timestamp, id) giảm dần, trang sau lấy các dòng "nhỏ hơn" cursor
+    if cursor:
+        timestamp, row_id = cursor
+        query = query.filter(db.or_(
+            model.timestamp < timestamp,
+            db.and_(model.timestamp == timestamp, model.id < row_id),
+        ))
+    rows = query.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
 # 1. Lấy danh sách các cuộc hội thoại
 @app.route('/api/conversations', methods=['GET'])
 @login_required
 def get_conversations():
-    convs = Conversation.query.filter_by(user_id=current_user.id).order_by(Conversation.timestamp.desc()).all()
-    return jsonify([{ "id": c.id, "title": c.title } for c in convs])
+    try:
+        limit, cursor = page_args()
+    except (ValueError, TypeError):
+        return jsonify({"error": "cursor không hợp lệ"}), 400
+    query = Conversation.query.filter_by(user_id=current_user.id)
+    with span("db"):
+        if limit is None:
+            convs = query.order_by(Conversation.timestamp.desc()).all()
+        else:
+            convs, next_cursor = keyset_page(query, Conversation, limit, cursor)
+    items = [{ "id": c.id, "title": c.title } for c in convs]
+    if limit is None:
+        return jsonify(items)
+    return jsonify({"items": items, "next_cursor": next_cursor})
 
 # 2. Tạo cuộc hội thoại mới
 @app.route('/api/conversation/new', methods=['POST'])
@@ -302,12 +407,28 @@ def new_conversation():
 @app.route('/api/conversation/<int:conv_id>', methods=['GET'])
 @login_required
 def get_conversation_content(conv_id):
-    conv = Conversation.query.get_or_404(conv_id)
+    with span("db"):
+        conv = Conversation.query.get_or_404(conv_id)
     if conv.user_id != current_user.id:
         return jsonify({"error": "Không có quyền truy cập"}), 403
     
-    messages = ChatMessage.query.filter_by(conversation_id=conv.id).order_by(ChatMessage.timestamp).all()
-    return jsonify([{ "role": m.role, "content": m.content } for m in messages])
+    try:
+        limit, cursor = page_args()
+    except (ValueError, TypeError):
+        return jsonify({"error": "cursor không hợp lệ"}), 400
+    query = ChatMessage.query.filter_by(conversation_id=conv.id)
+    with span("db"):
+        if limit is None:
+            messages = query.order_by(ChatMessage.timestamp).all()
+        else:
+            # Trang đầu là các tin mới nhất; next_cursor dùng để tải các tin cũ hơn
+            messages, next_cursor = keyset_page(query, ChatMessage, limit, cursor)
+            messages.reverse()
+    with span("render"):
+        items = [{ "role": m.role, "content": render_cache.message_html(m) } for m in messages]
+    if limit is None:
+        return jsonify(items)
+    return jsonify({"items": items, "next_cursor": next_cursor})
 # 4. API Xóa cuộc hội thoại
 @app.route('/api/conversation/delete/<int:conv_id>', methods=['DELETE'])
 @login_required
@@ -340,6 +461,121 @@ def rename_conversation(conv_id):
     conv.title = new_title
     db.session.commit()
     return jsonify({"success": True})
+# --- CÁC HÀM DÙNG CHUNG CHO /api/chat VÀ /api/chat/stream ---
+# Mỗi lượt chat chỉ 1 transaction ghi: hội thoại mới, tiêu đề, tóm tắt và 2 tin nhắn
+# đều được lưu cùng lúc trong save_turn.
+def resolve_conversation(user_question, conv_id):
+    # Trả về (conv, lỗi). Hội thoại mới chỉ được tạo trong bộ nhớ, lưu ở save_turn
+    if not conv_id:
+        return Conversation(user_id=current_user.id, title=user_question[:30]), None
+
+    conv = Conversation.query.get(conv_id)
+    # BẢO MẬT: Kiểm tra quyền sở hữu
+    if not conv or conv.user_id != current_user.id:
+        return None, (jsonify({"response": "Lỗi: Không tìm thấy cuộc hội thoại"}), 403)
+    return conv, None
+
+def load_history(conv):
+    # TÁI TẠO LỊCH SỬ CHAT (QUAN TRỌNG ĐỂ RIÊNG TƯ)
+    # Chỉ lấy các tin nhắn chưa được gộp vào bản tóm tắt
+    if conv.id is None:
+        return history_manager.prepare(conv, [])
+    messages = ChatMessage.query.filter(
+        ChatMessage.conversation_id == conv.id,
+        ChatMessage.id > (conv.summarized_until or 0)
+    ).order_by(ChatMessage.timestamp).all()
+    return history_manager.prepare(conv, messages)
+
+def answer_cache_key(kb, user_question, history):
+    # Chỉ cache câu hỏi đầu tiên của cuộc trò chuyện hoặc câu hỏi không phụ thuộc ngữ cảnh
+    if not (history.recent or history.digest) or is_context_free(user_question):
+        return answer_cache.key_for(user_question, kb.knowledge_hash)
+    return None
+
+def answer_locally(kb, user_question):
+    # Các câu hỏi trả lời được bằng tính toán chính xác thì không cần gọi Gemini
+    candidate = parse_score_question(user_question)
+    if candidate:
+        try:
+            return format_score_reply(kb.score_engine.score(candidate))
+        except ScoringError as e:
+            print(f"Không tự tính được điểm, chuyển cho Gemini: {e}")
+    # Tra cứu điểm chuẩn / học phí / mã ngành / chỉ tiêu trực tiếp từ bảng
+    return kb.tables.answer(user_question)
+
+def start_chat_session(kb, user_question, history):
+    # Chỉ thị cố định đã nằm trong system_instruction/context cache, không gửi lại như 1 lượt chat
+    gemini_history = []
+    turn_context = get_turn_context(kb, user_question, history)
+    if turn_context:
+        gemini_history += [
+            {"role": "user", "parts": [turn_context]},
+            {"role": "model", "parts": ["Dạ, mình đã nắm được thông tin. FIT-Bot sẵn sàng hỗ trợ."]}
+        ]
+
+    for role, text in history.recent:
+        gemini_history.append({"role": "user" if role == "user" else "model", "parts": [text]})
+
+    # Khởi tạo session MỚI (Local variable)
+    return context_cache.get_model(kb.context_instruction).start_chat(history=gemini_history)
+
+def render_reply(text):
+    # Format câu trả lời hoàn chỉnh (nhớ theo hash nội dung); đoạn stream dở dang dùng render_markdown
+    return render_cache.render(text)
+
+def call_gemini(chat_session, user_question, key=None):
+    # key (khóa cache câu trả lời): câu hỏi giống hệt đang chờ Gemini thì dùng chung 1 lời gọi
+    try:
+        return gemini_client.send(chat_session, user_question, key=key)
+    except Exception as e:
+        record_upstream_error(e)
+        raise
+
+@contextmanager
+def stream_gemini(chat_session, user_question):
+    # Như call_gemini nhưng trả về stream; giữ slot của limiter tới khi đọc xong
+    try:
+        with gemini_client.stream(chat_session, user_question) as response:
+            yield response
+    except Exception as e:
+        record_upstream_error(e)
+        raise
+
+@contextmanager
+def commit_without_expire():
+    # Chỉ cho các commit trong lượt chat: không expire object sau commit để đọc lại
+    # current_user / conv.id / conv.title mà không phải SELECT lại
+    session = db.session()
+    previous = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        yield
+    finally:
+        session.expire_on_commit = previous
+
+def release_connection(conv):
+    # Trả connection về pool trong lúc chờ Gemini (vài giây) thay vì giữ transaction đọc mở.
+    # conv được tách khỏi session, giữ nguyên các thay đổi chưa lưu và được gắn lại ở save_turn.
+    if conv in db.session:
+        db.session.expunge(conv)
+    with commit_without_expire():
+        db.session.commit()
+
+def save_turn(conv, user_question, bot_reply):
+    # bot_reply: markdown gốc. Trả về id hội thoại (hội thoại mới có id sau khi INSERT)
+    # Tiêu đề chỉ được đặt ở đây: đặt sớm hơn thì autoflush ghi nó ngay ở câu SELECT lịch sử
+    if conv.title == "Cuộc trò chuyện mới":
+        conv.title = user_question[:40] + "..." if len(user_question) > 40 else user_question
+    db.session.add(conv)
+    if conv.id is None:
+        db.session.flush()
+    user_msg = ChatMessage(conversation_id=conv.id, **message_fields('user', user_question))
+    bot_msg = ChatMessage(conversation_id=conv.id, **message_fields('bot', bot_reply))
+    db.session.add_all([user_msg, bot_msg])
+    with commit_without_expire():
+        db.session.commit()
+    return conv.id
+
 # 4. Gửi tin nhắn (Cập nhật để hỗ trợ conversation_id)
 @app.route('/api/chat', methods=['POST'])
 @login_required
@@ -351,73 +587,197 @@ def chat():
     if not user_question: return jsonify({"response": "Rỗng"})
 
     # 1. Xử lý Conversation ID
-    if not conv_id:
-        new_conv = Conversation(user_id=current_user.id, title=user_question[:30])
-        db.session.add(new_conv)
-        db.session.commit()
-        conv_id = new_conv.id
-    else:
-        conv = Conversation.query.get(conv_id)
-        # BẢO MẬT: Kiểm tra quyền sở hữu
-        if not conv or conv.user_id != current_user.id:
-             return jsonify({"response": "Lỗi: Không tìm thấy cuộc hội thoại"}), 403
-        
-        # Cập nhật tiêu đề nếu cần
-        if conv.title == "Cuộc trò chuyện mới":
-            conv.title = user_question[:40] + "..." if len(user_question) > 40 else user_question
-            db.session.commit()
+    with span("conversation"):
+        conv, error = resolve_conversation(user_question, conv_id)
+    if error: return error
 
+    kb = current_knowledge()
     try:
-        # 2. TÁI TẠO LỊCH SỬ CHAT (QUAN TRỌNG ĐỂ RIÊNG TƯ)
-        # Lấy tin nhắn cũ từ DB
-        old_messages = ChatMessage.query.filter_by(conversation_id=conv_id).order_by(ChatMessage.timestamp).all()
-        
-        # Tạo history chuẩn format Gemini
-        gemini_history = [
-            {"role": "user", "parts": [context_instruction]},
-            {"role": "model", "parts": ["Dạ, mình đã hiểu. FIT-Bot sẵn sàng hỗ trợ."]}
-        ]
-        
-        for msg in old_messages:
-            role = "user" if msg.role == "user" else "model"
-            gemini_history.append({"role": role, "parts": [msg.content]})
-
-        # Khởi tạo session MỚI (Local variable)
-        chat_session = model.start_chat(history=gemini_history)
-
-        # 3. Gửi tin nhắn mới
-        response = chat_session.send_message(user_question)
-        
-        # Format câu trả lời
-        bot_reply = markdown.markdown(
-            response.text, 
-            extensions=['extra', 'nl2br', 'sane_lists']
-        )
-        
-        # 4. Lưu vào Database
-        user_msg = ChatMessage(content=user_question, role='user', conversation_id=conv_id)
-        bot_msg = ChatMessage(content=bot_reply, role='bot', conversation_id=conv_id)
-        db.session.add_all([user_msg, bot_msg])
-        db.session.commit()
+        # 2. Tái tạo lịch sử chat
+        with span("history"):
+            history = load_history(conv)
+        with span("local"):
+            bot_reply = answer_locally(kb, user_question)
+        cache_key = answer_cache_key(kb, user_question, history) if bot_reply is None else None
+        if cache_key:
+            with span("cache"):
+                bot_reply = answer_cache.get(cache_key)
+
+        if bot_reply is None:
+            with span("prompt"):
+                chat_session = start_chat_session(kb, user_question, history)
+            release_connection(conv)
+
+            # 3. Gửi tin nhắn mới
+            response = call_gemini(chat_session, user_question, key=cache_key)
+            bot_reply = response.text
+            if cache_key: answer_cache.set(cache_key, bot_reply)
+
+        with span("render"):
+            html = render_reply(bot_reply)
+        # 4. Lưu vào Database (markdown gốc, HTML chỉ gửi cho client)
+        with span("commit"):
+            conv_id = save_turn(conv, user_question, bot_reply)
 
         return jsonify({
-            "response": bot_reply,
+            "response": html,
             "conversation_id": conv_id,
-            "new_title": conv.title if conv else None
+            "new_title": conv.title
         })
 
+    except UpstreamBusy as e:
+        print(f"Từ chối Chat: {e}")
+        return jsonify({"response": "Hệ thống đang quá tải, vui lòng thử lại sau."}), 503
     except Exception as e:
-        print(f"Lỗi Chat: {e}")
+        print(f"Lỗi Chat ở bước {failed_stage()}: {type(e).__name__}: {e}")
         return jsonify({"response": "Hệ thống đang quá tải, vui lòng thử lại sau."})
 
+# 4b. Gửi tin nhắn dạng stream (Server-Sent Events)
+# Mỗi đoạn Gemini trả về được đẩy ngay xuống client:
+#   event: delta -> {"text": đoạn mới, "html": toàn bộ câu trả lời đã render tới hiện tại}
+#   event: done  -> {"response", "conversation_id", "new_title"} (đã lưu DB)
+#   event: error -> {"response": thông báo lỗi}
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    data = request.json
+    user_question = data.get('message')
+    conv_id = data.get('conversation_id')
+
+    if not user_question: return jsonify({"response": "Rỗng"})
+
+    with span("conversation"):
+        conv, error = resolve_conversation(user_question, conv_id)
+    if error: return error
+
+    kb = current_knowledge()
+
+    def generate():
+        parts = []
+        conv_id = conv.id
+        try:
+            with span("history"):
+                history = load_history(conv)
+            with span("local"):
+                cached = answer_locally(kb, user_question)
+            cache_key = answer_cache_key(kb, user_question, history) if cached is None else None
+            if cache_key:
+                with span("cache"):
+                    cached = answer_cache.get(cache_key)
+            if cached is not None:
+                with span("render"):
+                    html = render_reply(cached)
+                with span("commit"):
+                    conv_id = save_turn(conv, user_question, cached)
+                yield sse_event("done", {"response": html, "conversation_id": conv_id, "new_title": conv.title})
+                return
+
+            with span("prompt"):
+                chat_session = start_chat_session(kb, user_question, history)
+            release_connection(conv)
+            with stream_gemini(chat_session, user_question) as response:
+                # Thời gian tới đoạn đầu tiên và toàn bộ thời gian stream (gồm cả gửi xuống client)
+                stream_start = time.perf_counter()
+                last_chunk = None
+                with span("stream"):
+                    for chunk in response:
+                        if last_chunk is None:
+                            record_span("first_token", time.perf_counter() - stream_start)
+                        last_chunk = chunk
+                        if not chunk.parts:
+                            continue
+                        parts.append(chunk.text)
+                        # Render lại toàn bộ để markdown dở dang (list, bảng...) luôn hiển thị đúng
+                        yield sse_event("delta", {"text": chunk.text, "html": render_markdown("".join(parts))})
+                record_usage(last_chunk)
+
+            bot_reply = "".join(parts)
+            with span("render"):
+                html = render_reply(bot_reply)
+            with span("commit"):
+                conv_id = save_turn(conv, user_question, bot_reply)
+            if cache_key: answer_cache.set(cache_key, bot_reply)
+            yield sse_event("done", {
+                "response": html,
+                "conversation_id": conv_id,
+                "new_title": conv.title
+            })
+        except GeneratorExit:
+            # Client đóng kết nối giữa chừng: dừng đọc từ Gemini, không lưu câu trả lời dở
+            print(f"Client ngắt stream (conversation {conv_id}) sau {len(parts)} đoạn")
+            raise
+        except Exception as e:
+            print(f"Lỗi Chat Stream ở bước {failed_stage()}: {type(e).__name__}: {e}")
+            yield sse_event("error", {"response": "Hệ thống đang quá tải, vui lòng thử lại sau."})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'X-Accel-Buffering': 'no'  # Tắt buffer của proxy để token tới client ngay
+    })
+
+
+# 6. Tính điểm xét tuyển (không qua Gemini)
+# Nhận 1 thí sinh hoặc {"candidates": [...]} để tính cả lô:
+#   {"method": 2, "total": 29.5, "award": "giải nhì HSG tỉnh", "priority": "KV1"}
+#   {"method": 3, "total": 1150, "bonus_base": 1.5, "priority": 30}
+@app.route('/api/score', methods=['POST'])
+@login_required
+def score():
+    data = request.json or {}
+    score_engine = current_knowledge().score_engine
+    if isinstance(data, dict) and isinstance(data.get('candidates'), list):
+        return jsonify({"success": True, "results": score_engine.score_many(data['candidates'])})
+    try:
+        return jsonify({"success": True, **score_engine.score(data)})
+    except (ScoringError, TypeError, ValueError) as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+
+# 7. Nạp lại dữ liệu data/ khi đang chạy (chỉ file thay đổi bị đọc lại)
+#   curl -X POST -H "Authorization: Bearer $ADMIN_TOKEN" .../api/admin/reload-knowledge
+# Worker nhận request nạp lại ngay; các worker khác thấy file đánh dấu và tự nạp lại ở nền.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+@app.route('/api/admin/reload-knowledge', methods=['POST'])
+def reload_knowledge():
+    if not ADMIN_TOKEN or request.headers.get("Authorization") != f"Bearer {ADMIN_TOKEN}":
+        return jsonify({"success": False, "message": "Unauthorized"}), 403
+    try:
+        result = knowledge_reloader.reload("admin")
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Lỗi nạp lại dữ liệu, vẫn dùng dữ liệu cũ: {e}"}), 500
+    if result is None:
+        return jsonify({"success": False, "message": "Đang nạp lại dữ liệu, thử lại sau"}), 409
+    knowledge_reloader.publish()
+    return jsonify({"success": True, **result})
+
+@app.before_request
+def check_knowledge_updates():
+    knowledge_reloader.maybe_reload()
+
 
 # --- 5. CHẠY ỨNG DỤNG ---
 @app.route('/ping')
 def ping():
     return "Pong", 200
+
+# Thời gian từng bước của mọi request + GET /metrics cho Prometheus
+metrics.init_app(app, {
+    "upstream": lambda: upstream_limiter.stats(),
+    "gemini": lambda: gemini_client.stats(),
+    "answer_cache": lambda: answer_cache.stats(),
+    "context_cache": lambda: context_cache.stats(),
+    "render_cache": lambda: render_cache.stats(),
+    "knowledge": lambda: knowledge_reloader.stats(),
+})
 # --- THÊM ĐOẠN NÀY RA NGOÀI ĐỂ RENDER CHẠY ĐƯỢC ---
 with app.app_context():
     db.create_all()
+    run_migrations(db)
+    # Hash dữ liệu lúc khởi động; worker fork lại sau này so với file này để biết cần nạp lại
+    knowledge_reloader.publish()
     print(">>> Đã khởi tạo Database trên Render thành công!")
 # -----------------------------------------------------
 
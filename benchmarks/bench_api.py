@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- BENCHMARK CÁC API CHÍNH (IN-PROCESS, SQLITE, GEMINI GIẢ) ---
+# Tạo nhiều user, mỗi user nhiều cuộc trò chuyện và 1 cuộc trò chuyện rất dài, rồi bắn
+# song song /api/login, /api/conversations, /api/conversation/<id> và /api/chat.
+# Gemini được thay bằng benchmarks.fake_gemini.FakeClient (trễ, tốc độ token, tỉ lệ lỗi).
+# In ra p50/p95/p99, throughput từng API và peak RSS của process.
+#   python -m benchmarks.bench_api --users 50 --history 400 --concurrency 16
+#   python -m benchmarks.bench_api --save baseline.json
+#   python -m benchmarks.bench_api --compare baseline.json   # exit 1 nếu p95 chậm hơn ngưỡng
+
+PASSWORD = "bench-password"
+FOLLOW_UPS = [
+    "Còn học phí ngành đó thì sao?",
+    "Vậy điểm chuẩn năm ngoái của ngành đó là bao nhiêu?",
+    "Ngành này học những môn gì?",
+    "Ra trường thì làm việc ở đâu?",
+]
+# Câu trả lời markdown, cỡ một câu trả lời thật của bot
+BOT_REPLY = "Dạ, theo thông tin tuyển sinh năm 2025:\n\n" + \
+    "\n".join(f"- Ý số {i}: nội dung giải thích chi tiết về chương trình đào tạo và học phí." for i in range(20))
+
+
+def setup_app(args):
+    # Biến môi trường phải có trước khi import app (cấu hình DB, Gemini được đọc lúc import).
+    # Mặc định SQLite tạm; đặt DATABASE_URL (database trống) để đo trên Postgres.
+    db_path = None
+    if not os.environ.get("DATABASE_URL"):
+        db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("GOOGLE_API_KEY", "fake")
+    os.environ["GEMINI_CONTEXT_CACHE"] = "0"
+    os.environ.pop("REDIS_URL", None)
+
+    import app as app_module
+    from benchmarks.fake_gemini import FakeClient
+    from context_cache import ContextCacheManager
+
+    fake = FakeClient(latency=args.latency, token_rate=args.token_rate,
+                      failure_rate=args.failure_rate, seed=args.seed)
+    app_module.context_cache = ContextCacheManager(app_module.MODEL_NAME, client=fake, enabled=False)
+    # Test client chạy qua http nên tắt cờ Secure để cookie session được gửi lại
+    app_module.app.config["SESSION_COOKIE_SECURE"] = False
+    return app_module, fake, db_path
+
+
+def seed(app_module, args):
+    from werkzeug.security import generate_password_hash
+    from message_store import message_fields
+    db, User, Conversation, ChatMessage = (app_module.db, app_module.User,
+                                           app_module.Conversation, app_module.ChatMessage)
+    # Hash mật khẩu 1 lần cho mọi user, tránh seed mất vài phút vì scrypt
+    hashed = generate_password_hash(PASSWORD)
+    long_convs = {}
+    with app_module.app.app_context():
+        users = [User(username=f"bench{i}", password=hashed) for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.flush()
+        for user in users:
+            convs = [Conversation(user_id=user.id, title=f"Hội thoại {j}") for j in range(args.conversations)]
+            db.session.add_all(convs)
+            db.session.flush()
+            long_convs[user.username] = convs[-1].id
+            rows = []
+            for conv in convs[:-1]:
+                rows += [ChatMessage(conversation_id=conv.id, **message_fields("user", "Học phí ngành AI?")),
+                         ChatMessage(conversation_id=conv.id, **message_fields("bot", BOT_REPLY))]
+            for k in range(args.history // 2):
+                rows += [ChatMessage(conversation_id=convs[-1].id, **message_fields("user", f"{FOLLOW_UPS[k % 4]} ({k})")),
+                         ChatMessage(conversation_id=convs[-1].id, **message_fields("bot", BOT_REPLY))]
+            db.session.add_all(rows)
+        db.session.commit()
+    return long_convs
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def peak_rss_mb():
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class Session:
+    # Mỗi user 1 test client riêng (giữ cookie), khóa lại để không dùng chung giữa 2 thread
+    def __init__(self, app, username, long_conv_id):
+        self.client = app.test_client()
+        self.username = username
+        self.long_conv_id = long_conv_id
+        self.lock = threading.Lock()
+
+
+def run_phase(name, sessions, total, concurrency, call):
+    def one(i):
+        session = sessions[i % len(sessions)]
+        with session.lock:
+            start = time.perf_counter()
+            try:
+                ok = call(session, i)
+            except Exception as e:
+                print(f"   ❌ {name}: {e}")
+                ok = False
+            return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(lat * 1000 for _, lat in results)
+    return {
+        "name": name,
+        "requests": total,
+        "errors": sum(1 for ok, _ in results if not ok),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "throughput": round(total / elapsed, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def call_login(session, i):
+    res = session.client.post("/api/login", json={"username": session.username, "password": PASSWORD})
+    return res.status_code == 200 and res.get_json()["success"]
+
+
+def call_conversations(session, i):
+    return session.client.get("/api/conversations").status_code == 200
+
+
+def call_conversation(session, i):
+    return session.client.get(f"/api/conversation/{session.long_conv_id}").status_code == 200
+
+
+def call_chat(session, i):
+    res = session.client.post("/api/chat", json={
+        "message": f"{FOLLOW_UPS[i % len(FOLLOW_UPS)]} (bench {i})",
+        "conversation_id": session.long_conv_id,
+    })
+    # /api/chat trả 200 kèm thông báo quá tải khi Gemini lỗi, nên phải xem nội dung
+    return res.status_code == 200 and "quá tải" not in res.get_json()["response"]
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["phases"]}
+    regressions = []
+    for r in results:
+        old = baseline.get(r["name"])
+        if old and r["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['name']}: p95 {old['p95_ms']}ms -> {r['p95_ms']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các API chính với Gemini giả")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=20, help="Số cuộc trò chuyện mỗi user")
+    parser.add_argument("--history", type=int, default=400, help="Số tin nhắn của cuộc trò chuyện dài")
+    parser.add_argument("--requests", type=int, default=200, help="Số request mỗi API")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="Độ trễ của Gemini giả (giây)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Token/giây của Gemini giả (0 = tức thì)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Tỉ lệ lời gọi Gemini bị lỗi")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="Ghi kết quả ra file JSON")
+    parser.add_argument("--compare", help="So sánh với file JSON đã lưu")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Cho phép p95 chậm hơn bao nhiêu (0.2 = 20%%)")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    app_module, fake, db_path = setup_app(args)
+    start = time.perf_counter()
+    long_convs = seed(app_module, args)
+    size = f" ({os.path.getsize(db_path) / 1e6:.1f} MB)" if db_path else ""
+    print(f">>> Seed {args.users} user x {args.conversations} hội thoại, hội thoại dài {args.history} tin nhắn "
+          f"trong {time.perf_counter() - start:.1f}s{size}")
+
+    sessions = [Session(app_module.app, name, conv_id) for name, conv_id in long_convs.items()]
+    phases = [
+        # Mỗi user đăng nhập đúng 1 lần để các API sau có cookie
+        ("login", len(sessions), call_login),
+        ("conversations", args.requests, call_conversations),
+        ("conversation", args.requests, call_conversation),
+        ("chat", args.requests, call_chat),
+    ]
+    results = []
+    print(f"{'API':<14}{'req':>6}{'lỗi':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'RSS MB':>9}")
+    for name, total, call in phases:
+        r = run_phase(name, sessions, total, args.concurrency, call)
+        results.append(r)
+        print(f"{r['name']:<14}{r['requests']:>6}{r['errors']:>6}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['throughput']:>9}{r['peak_rss_mb']:>9}")
+    print(f">>> Gemini giả: {fake.calls} lời gọi, {fake.failures} lỗi; peak RSS {peak_rss_mb():.1f} MB")
+
+    report = {"args": vars(args), "phases": results, "peak_rss_mb": round(peak_rss_mb(), 1)}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"   ❌ Chậm hơn baseline: {line}")
+        if regressions:
+            sys.exit(1)
+        print(">>> Không có API nào chậm hơn baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import itertools
+from collections import Counter
+from sqlalchemy import event
+
+# --- ĐẾM SỐ LẦN GỌI DATABASE MỖI REQUEST ---
+# Mỗi câu SQL, COMMIT, ROLLBACK là 1 round trip tới database (với Postgres là 1 lần qua mạng).
+# Chạy trên SQLite tạm (mặc định) hoặc Postgres local:
+#   python -m benchmarks.bench_db_roundtrips
+#   DATABASE_URL=postgresql://localhost/fitbot_bench python -m benchmarks.bench_db_roundtrips -v
+
+# conv_id của kịch bản: hội thoại dài đã seed; NEW_CONVERSATION = hội thoại vừa tạo qua
+# /api/conversation/new (tiêu đề mặc định, lượt chat đầu tiên sẽ đặt lại tiêu đề)
+NEW_CONVERSATION = "new"
+# Câu hỏi mỗi lần khác nhau để không trúng cache câu trả lời (phải đi qua nhánh gọi Gemini)
+_question_ids = itertools.count(1)
+SCENARIOS = [
+    ("chat: hội thoại mới", "POST", "/api/chat", lambda conv_id: {"message": "Học phí ngành AI bao nhiêu?"}),
+    ("chat: hội thoại vừa tạo", "POST", "/api/chat",
+     lambda conv_id: {"message": f"Ngành AI học những gì? ({next(_question_ids)})", "conversation_id": conv_id, "fresh": NEW_CONVERSATION}),
+    ("chat: hỏi tiếp", "POST", "/api/chat", lambda conv_id: {"message": "Còn ngành đó thì sao?", "conversation_id": conv_id}),
+    ("chat/stream: hỏi tiếp", "POST", "/api/chat/stream", lambda conv_id: {"message": "Ra trường làm gì?", "conversation_id": conv_id}),
+    ("danh sách hội thoại", "GET", "/api/conversations?limit=30", None),
+    ("nội dung hội thoại", "GET", "/api/conversation/{conv_id}?limit=40", None),
+]
+
+
+class RoundTripCounter:
+    def __init__(self, engine):
+        self.statements = []
+        self.transactions = Counter()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", lambda conn: self.transactions.update(["COMMIT"]))
+        event.listen(engine, "rollback", lambda conn: self.transactions.update(["ROLLBACK"]))
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split())[:120])
+
+    def reset(self):
+        self.statements.clear()
+        self.transactions.clear()
+
+    @property
+    def total(self):
+        return len(self.statements) + sum(self.transactions.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đếm round trip database của các API chat")
+    parser.add_argument("-v", "--verbose", action="store_true", help="In từng câu SQL")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần chạy mỗi kịch bản")
+    args = parser.parse_args()
+
+    from benchmarks import bench_api
+    setup = argparse.Namespace(latency=0.0, token_rate=0.0, failure_rate=0.0, seed=1,
+                               users=1, conversations=3, history=40)
+    app_module, _, _ = bench_api.setup_app(setup)
+    long_convs = bench_api.seed(app_module, setup)
+    conv_id = next(iter(long_convs.values()))
+
+    client = app_module.app.test_client()
+    client.post("/api/login", json={"username": "bench0", "password": bench_api.PASSWORD})
+    with app_module.app.app_context():
+        counter = RoundTripCounter(app_module.db.engine)
+
+    print(f"{'Kịch bản':<26}{'SQL':>6}{'COMMIT':>8}{'ROLLBACK':>10}{'Tổng':>7}")
+    for name, method, path, payload in SCENARIOS:
+        for i in range(args.repeat):
+            body = payload(conv_id) if payload else None
+            if body and body.pop("fresh", None) == NEW_CONVERSATION:
+                body["conversation_id"] = client.post("/api/conversation/new").get_json()["id"]
+            counter.reset()
+            res = client.open(path.format(conv_id=conv_id), method=method, json=body)
+            res.get_data()
+            res.close()
+        print(f"{name:<26}{len(counter.statements):>6}{counter.transactions['COMMIT']:>8}"
+              f"{counter.transactions['ROLLBACK']:>10}{counter.total:>7}")
+        if args.verbose:
+            for statement in counter.statements:
+                print(f"      {statement}")
+
+
+if __name__ == "__main__":
+    main()
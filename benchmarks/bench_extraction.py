@@ -0,0 +1,51 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from knowledge import ExtractionCache, extract_corpus, knowledge_hash
+
+# --- BENCHMARK TRÍCH XUẤT DỮ LIỆU (KHÔNG DÙNG CACHE) ---
+# Tạo corpus giả lớn gấp N lần data/ (chép N bản vào các thư mục con) rồi trích xuất lạnh
+# với 1 process và với process pool, kiểm tra kết quả giống hệt nhau.
+#   python -m benchmarks.bench_extraction --copies 10 --workers 4
+
+
+def build_corpus(source, copies):
+    root = tempfile.mkdtemp(prefix="kb_corpus_")
+    for i in range(copies):
+        shutil.copytree(source, os.path.join(root, f"ban_{i:02d}"))
+    return root
+
+
+def run(root, workers):
+    start = time.perf_counter()
+    text, report = extract_corpus(root, ExtractionCache(None), workers)
+    elapsed = time.perf_counter() - start
+    errors = [r for r in report if r["error"]]
+    cpu = sum(r["seconds"] for r in report)
+    print(f"{workers:>3} process: {elapsed:6.2f}s ({cpu:.2f}s trích xuất), {len(report)} file, "
+          f"{len(errors)} lỗi, {len(text)} ký tự, hash {knowledge_hash(text)}")
+    return elapsed, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark trích xuất data/ tuần tự và song song")
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--copies", type=int, default=10, help="Corpus giả lớn gấp bao nhiêu lần data/")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    root = build_corpus(args.data, args.copies)
+    try:
+        print(f">>> Corpus {args.copies}x data/ tại {root}; máy có {os.cpu_count()} CPU")
+        serial, serial_text = run(root, 1)
+        parallel, parallel_text = run(root, args.workers)
+        assert serial_text == parallel_text, "Kết quả song song khác tuần tự"
+        print(f">>> Song song nhanh gấp {serial / parallel:.2f} lần, kết quả giống hệt nhau")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import time
+import argparse
+from knowledge import read_data_recursive
+from retrieval import RetrievalIndex, TOP_K
+
+# --- SO SÁNH PROMPT: FULL CONTEXT vs RETRIEVAL ---
+# Chạy offline (không gọi Gemini): đo kích thước ngữ cảnh gửi đi và tỉ lệ câu hỏi mà
+# ngữ cảnh có chứa đáp án đúng. Chế độ full luôn chứa đáp án nên recall = 100%.
+#   python -m benchmarks.bench_retrieval [--top-k 8]
+
+QUESTIONS = [
+    ("Học phí ngành Trí tuệ nhân tạo năm nhất là bao nhiêu?", ["35.500.000"]),
+    ("hoc phi khmt chuong trinh tien tien", ["67.000.000"]),
+    ("Học phí năm 4 ngành Công nghệ thông tin tăng cường tiếng Anh", ["86.900.000"]),
+    ("Điểm chuẩn phương thức 2 ngành Khoa học máy tính tiên tiến 2025", ["29.92"]),
+    ("điểm chuẩn đánh giá năng lực ngành trí tuệ nhân tạo", ["1092"]),
+    ("Điểm chuẩn phương thức 1d ngành tăng cường tiếng Anh", ["28.99"]),
+    ("Giải nhì học sinh giỏi cấp tỉnh được cộng bao nhiêu điểm?", ["1,50"]),
+    ("Công thức tính điểm cộng khi tổng điểm từ 28 trở lên", ["(30 – Tổng điểm"]),
+    ("Điểm cộng ĐGNL thang 1200 tính thế nào khi trên 1120 điểm", ["/ 80]"]),
+    ("Chỉ tiêu tuyển sinh ngành Công nghệ thông tin tăng cường tiếng Anh", ["520"]),
+    ("Mã ngành Trí tuệ nhân tạo là gì?", ["7480107"]),
+    ("Nhóm ngành Máy tính và CNTT gồm những ngành nào?", ["Kỹ thuật phần mềm"]),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    args = parser.parse_args()
+
+    knowledge = read_data_recursive("data")
+    start = time.perf_counter()
+    index = RetrievalIndex.build(knowledge)
+    build_s = time.perf_counter() - start
+
+    hits, sizes, search_ms = 0, [], []
+    for question, expected in QUESTIONS:
+        t0 = time.perf_counter()
+        context = index.context_for(question, args.top_k)
+        search_ms.append((time.perf_counter() - t0) * 1000)
+        found = all(e in context for e in expected)
+        hits += found
+        sizes.append(len(context))
+        print(f"{'✅' if found else '❌'} {len(context):>7} ký tự  {question}")
+
+    full = len(knowledge)
+    avg = sum(sizes) / len(sizes)
+    print("-" * 60)
+    print(f"Index: {len(index.chunks)} đoạn, dựng trong {build_s * 1000:.0f} ms")
+    print(f"Full context : {full:>8} ký tự/câu (~{full // 4} token), recall 100%")
+    print(f"Retrieval k={args.top_k}: {avg:>8.0f} ký tự/câu (~{avg / 4:.0f} token), "
+          f"recall {hits}/{len(QUESTIONS)} ({100 * hits / len(QUESTIONS):.0f}%)")
+    print(f"Giảm {100 * (1 - avg / full):.1f}% ngữ cảnh, tìm kiếm trung bình {sum(search_ms) / len(search_ms):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
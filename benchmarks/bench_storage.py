@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+from message_store import RenderCache, render_markdown, pack, COMPRESS_MIN_BYTES
+from history import html_to_text, estimate_tokens
+from benchmarks.bench_api import BOT_REPLY
+from benchmarks.fake_gemini import DEFAULT_REPLY
+
+# --- SO SÁNH CÁCH LƯU CÂU TRẢ LỜI CỦA BOT ---
+# html : cách cũ, lưu HTML đã render
+# md   : lưu markdown gốc
+# md+z : markdown gốc, tin dài (>= MESSAGE_COMPRESS_MIN_BYTES) nén zlib vào cột packed
+# In ra: byte/tin, dung lượng file SQLite, token lịch sử gửi lại Gemini, byte trả về cho
+# /api/conversation/<id> và thời gian render 1 trang tin nhắn (lần đầu / đã nhớ).
+#   python -m benchmarks.bench_storage --messages 20000
+
+
+def sample_replies():
+    # Câu trả lời thật từ bảng tra cứu (dài, nhiều danh sách) + câu trả lời mẫu ngắn
+    replies = [BOT_REPLY, DEFAULT_REPLY]
+    try:
+        from admission_tables import AdmissionTables
+        tables = AdmissionTables()
+        for question in ("Điểm chuẩn APCS", "Điểm chuẩn các ngành năm 2024", "Học phí các ngành",
+                         "Điểm chuẩn ĐGNL các ngành", "Mã ngành trí tuệ nhân tạo"):
+            reply = tables.answer(question)
+            if reply:
+                replies.append(reply)
+    except Exception as e:
+        print(f"   ⚠️ Không dựng được bảng tra cứu, chỉ dùng câu trả lời mẫu: {e}")
+    return replies
+
+
+def db_size(rows):
+    # rows: [(content, packed)] -> số byte file SQLite sau VACUUM
+    path = os.path.join(tempfile.mkdtemp(), "storage.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE chat_message (id INTEGER PRIMARY KEY, content TEXT NOT NULL, packed BLOB)")
+    conn.executemany("INSERT INTO chat_message (content, packed) VALUES (?, ?)", rows)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh cách lưu câu trả lời của bot")
+    parser.add_argument("--messages", type=int, default=20000, help="Số câu trả lời lưu vào DB thử")
+    parser.add_argument("--page", type=int, default=40, help="Số tin mỗi trang /api/conversation")
+    args = parser.parse_args()
+
+    replies = sample_replies()
+    bot_md = [replies[i % len(replies)] for i in range(args.messages)]
+    bot_html = [render_markdown(text) for text in replies]
+    layouts = {
+        "html": [(bot_html[i % len(replies)], None) for i in range(args.messages)],
+        "md": [(text, None) for text in bot_md],
+        "md+z": [pack(text) for text in bot_md],
+    }
+
+    print(f">>> {len(replies)} câu trả lời mẫu, {args.messages} tin, nén từ {COMPRESS_MIN_BYTES} byte")
+    print(f"{'Cách lưu':<10}{'byte/tin':>10}{'DB MB':>9}{'token lịch sử/tin':>20}")
+    history_tokens = {
+        "html": sum(estimate_tokens(html_to_text(h)) for h in bot_html) / len(replies),
+        "md": sum(estimate_tokens(t) for t in replies) / len(replies),
+    }
+    history_tokens["md+z"] = history_tokens["md"]
+    for name, rows in layouts.items():
+        stored = sum(len(c.encode("utf-8")) + len(p or b"") for c, p in rows) / len(rows)
+        print(f"{name:<10}{stored:>10.0f}{db_size(rows) / 1e6:>9.2f}{history_tokens[name]:>20.0f}")
+
+    # Client vẫn nhận HTML như cũ: payload không đổi, chỉ thêm bước render (được nhớ theo hash)
+    page = [{"role": "bot", "content": bot_html[i % len(replies)]} for i in range(args.page)]
+    payload = len(json.dumps(page, ensure_ascii=False).encode("utf-8"))
+    cache = RenderCache()
+    start = time.perf_counter()
+    for i in range(args.page):
+        cache.render(bot_md[i])
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(args.page):
+        cache.render(bot_md[i])
+    warm = time.perf_counter() - start
+    print(f">>> Trang {args.page} tin: payload {payload / 1024:.1f} KB (như cũ), render lần đầu {cold * 1000:.1f} ms, "
+          f"đã nhớ {warm * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
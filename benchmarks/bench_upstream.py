@@ -0,0 +1,99 @@
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fake_gemini import FakeClient
+from upstream import UpstreamLimiter, GeminiClient, CircuitBreaker
+
+# --- KIỂM TRA LỚP GỌI GEMINI KHI UPSTREAM CHẬM / LỖI ---
+# Chạy GeminiClient với Gemini giả (FakeClient) qua các kịch bản:
+#   flaky  : lỗi 503 ngẫu nhiên -> tỉ lệ thành công khi không / có thử lại
+#   slow   : Gemini treo lâu hơn timeout -> mỗi lượt kết thúc trong DEADLINE thay vì treo worker
+#   outage : Gemini sập hẳn -> ngắt mạch, request bị từ chối ngay; hồi phục -> mạch đóng lại
+#   burst  : nhiều request cùng 1 câu hỏi cùng lúc -> chỉ 1 lời gọi lên Gemini
+#   python -m benchmarks.bench_upstream
+#   python -m benchmarks.bench_upstream --failure-rate 0.5 --requests 400
+
+
+def make_client(fake, **kwargs):
+    kwargs.setdefault("rng", random.Random(1))
+    return GeminiClient(UpstreamLimiter(max_concurrent=64, max_queue=256), **kwargs)
+
+
+def run(client, fake, total, concurrency, key=None):
+    # -> (số lượt thành công, danh sách số giây mỗi lượt)
+    model = fake.GenerativeModel("fake")
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            client.send(model.start_chat(), f"Câu hỏi {i}", key=key)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    return sum(ok for ok, _ in results), [seconds for _, seconds in results]
+
+
+def flaky(args):
+    print(f"--- flaky: lỗi {args.failure_rate:.0%}, {args.requests} lượt ---")
+    for retries in (0, 2, 3):
+        fake = FakeClient(latency=0.01, failure_rate=args.failure_rate, seed=1)
+        # Ngưỡng ngắt mạch rất cao để chỉ đo tác dụng của thử lại
+        client = make_client(fake, max_retries=retries, backoff=0.01, max_delay=0.05,
+                             breaker=CircuitBreaker(failure_threshold=10 ** 6))
+        ok, _ = run(client, fake, args.requests, args.concurrency)
+        print(f"   thử lại {retries}: thành công {ok}/{args.requests} ({ok / args.requests:.1%}), "
+              f"{fake.calls} lời gọi Gemini")
+
+
+def slow(args):
+    print("--- slow: Gemini trễ 5s, timeout 0.3s/lần, deadline 2s/lượt ---")
+    fake = FakeClient(latency=5.0, seed=1)
+    client = make_client(fake, timeout=0.3, deadline=2.0, backoff=0.05,
+                         breaker=CircuitBreaker(failure_threshold=10 ** 6))
+    ok, seconds = run(client, fake, 8, 8)
+    print(f"   thành công {ok}/8, lâu nhất {max(seconds):.2f}s, {fake.calls} lời gọi ({fake.timeouts} hết giờ)")
+
+
+def outage(args):
+    print("--- outage: Gemini lỗi 100%, ngắt mạch sau 5 lỗi, thử lại sau 0.5s ---")
+    fake = FakeClient(latency=0.05, failure_rate=1.0, seed=1)
+    client = make_client(fake, backoff=0.01, breaker=CircuitBreaker(failure_threshold=5, reset_after=0.5))
+    ok, seconds = run(client, fake, 50, 1)
+    fast = [s for s in seconds if s < 0.01]
+    print(f"   thành công {ok}/50, {fake.calls} lời gọi Gemini, {len(fast)} lượt bị từ chối ngay "
+          f"(trung bình {sum(fast) / max(len(fast), 1) * 1000:.2f}ms)")
+    fake.failure_rate = 0.0
+    time.sleep(0.6)
+    ok, _ = run(client, fake, 10, 1)
+    print(f"   sau khi hồi phục: thành công {ok}/10, mạch {client.breaker.state}")
+
+
+def burst(args):
+    print(f"--- burst: {args.concurrency} request cùng 1 câu hỏi, Gemini trễ 0.5s ---")
+    for key in (None, "answer:same-question"):
+        fake = FakeClient(latency=0.5, seed=1)
+        client = make_client(fake)
+        start = time.perf_counter()
+        ok, _ = run(client, fake, args.concurrency, args.concurrency, key=key)
+        print(f"   {'gộp' if key else 'không gộp'}: thành công {ok}/{args.concurrency}, {fake.calls} lời gọi Gemini "
+              f"trong {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra thử lại / timeout / ngắt mạch / gộp lời gọi Gemini")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--failure-rate", type=float, default=0.3)
+    parser.add_argument("scenarios", nargs="*", default=["flaky", "slow", "outage", "burst"])
+    args = parser.parse_args()
+    for name in args.scenarios:
+        {"flaky": flaky, "slow": slow, "outage": outage, "burst": burst}[name](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import json
+import time
+import types
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from google.api_core import exceptions as api_exceptions
+
+# --- GEMINI GIẢ LẬP ---
+# 1. Server REST giả lập endpoint generateContent / streamGenerateContent để load-test
+#    gunicorn thật mà không tốn quota. Trỏ app vào đây bằng:
+#      GEMINI_TRANSPORT=rest GEMINI_API_ENDPOINT=http://127.0.0.1:8900 GOOGLE_API_KEY=fake
+#      python -m benchmarks.fake_gemini --port 8900 --latency 1.0 --token-rate 200 --failure-rate 0.05
+# 2. FakeClient: thay cho module google.generativeai ngay trong process (benchmark bằng test client).
+# Cả hai đều có: độ trễ cố định, tốc độ sinh token, tỉ lệ lỗi ngẫu nhiên.
+
+DEFAULT_REPLY = "Dạ, đây là câu trả lời **giả lập** từ server Gemini local.\n- Ý thứ nhất\n- Ý thứ hai"
+
+
+def _response_json(text, prompt_chars):
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_chars // 4,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": (prompt_chars + len(text)) // 4,
+        },
+    }
+
+
+def _generation_time(text, token_rate):
+    # Thời gian "sinh" câu trả lời theo tốc độ token/giây (~4 ký tự/token)
+    return (len(text) / 4) / token_rate if token_rate else 0.0
+
+
+def _split_reply(reply):
+    words = reply.split(" ")
+    return [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        reply = self.server.reply
+
+        if self.server.rng.random() < self.server.failure_rate:
+            self.server.failures += 1
+            payload = json.dumps({"error": {"code": 503, "message": "Fake overload", "status": "UNAVAILABLE"}}).encode()
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        if ":streamGenerateContent" in self.path:
+            # REST transport đọc stream dạng mảng JSON: [{...},{...}]
+            pieces = _split_reply(reply)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, piece in enumerate(pieces):
+                time.sleep(_generation_time(piece, self.server.token_rate))
+                prefix = "[" if i == 0 else ","
+                self._chunk(prefix + json.dumps(_response_json(piece, len(body))))
+            self._chunk("]")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        time.sleep(_generation_time(reply, self.server.token_rate))
+        payload = json.dumps(_response_json(reply, len(body))).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start(port=0, latency=1.0, reply=DEFAULT_REPLY, token_rate=0.0, failure_rate=0.0, seed=None):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.reply = reply
+    server.token_rate = token_rate
+    server.failure_rate = failure_rate
+    server.rng = random.Random(seed)
+    server.requests = 0
+    server.failures = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- STUB TRONG PROCESS ---
+class FakeResponse:
+    def __init__(self, text, prompt_chars):
+        self.text = text
+        self.parts = [types.SimpleNamespace(text=text)] if text else []
+        self.usage_metadata = types.SimpleNamespace(
+            prompt_token_count=prompt_chars // 4,
+            candidates_token_count=len(text) // 4,
+            cached_content_token_count=0,
+            total_token_count=(prompt_chars + len(text)) // 4,
+        )
+
+
+class FakeChatSession:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False, request_options=None, **kwargs):
+        client = self.model.client
+        prompt_chars = len(self.model.system_instruction or "") + len(str(content)) + sum(
+            len(str(p)) for h in self.history for p in h.get("parts", []))
+        with client.lock:
+            client.calls += 1
+            fail = client.rng.random() < client.failure_rate
+            if fail:
+                client.failures += 1
+        # Giống SDK thật: request_options={"timeout": ...} cắt lời gọi chậm bằng DeadlineExceeded
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and client.latency > timeout:
+            time.sleep(timeout)
+            with client.lock:
+                client.timeouts += 1
+            raise api_exceptions.DeadlineExceeded(f"Fake timeout sau {timeout:g}s")
+        time.sleep(client.latency)
+        if fail:
+            raise api_exceptions.ServiceUnavailable("Fake overload")
+        if stream:
+            return self._stream(prompt_chars)
+        time.sleep(_generation_time(client.reply, client.token_rate))
+        return FakeResponse(client.reply, prompt_chars)
+
+    def _stream(self, prompt_chars):
+        client = self.model.client
+        for piece in _split_reply(client.reply):
+            time.sleep(_generation_time(piece, client.token_rate))
+            yield FakeResponse(piece, prompt_chars)
+
+
+class FakeClient:
+    # Đủ giống google.generativeai cho ContextCacheManager: .GenerativeModel và .caching.
+    # latency/failure_rate/token_rate đổi được giữa chừng (vd giả lập Gemini sập rồi hồi phục).
+    def __init__(self, latency=0.2, token_rate=0.0, failure_rate=0.0, reply=DEFAULT_REPLY, seed=None):
+        client = self
+
+        class GenerativeModel:
+            def __init__(self, model_name=None, system_instruction=None, **kwargs):
+                self.system_instruction = system_instruction
+                self.client = client
+
+            def start_chat(self, history=None):
+                return FakeChatSession(self, history)
+
+        class CachedContent:
+            # Không giả lập context cache: ContextCacheManager sẽ dùng nhánh system_instruction
+            @classmethod
+            def list(cls, page_size=1):
+                raise api_exceptions.NotFound("Fake client không hỗ trợ cachedContents")
+
+        self.GenerativeModel = GenerativeModel
+        self.caching = types.SimpleNamespace(CachedContent=CachedContent)
+        self.latency = latency
+        self.token_rate = token_rate
+        self.failure_rate = failure_rate
+        self.reply = reply
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server Gemini giả lập")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=1.0, help="Số giây trễ mỗi lời gọi")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Số token/giây khi sinh câu trả lời (0 = tức thì)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Tỉ lệ lời gọi trả về lỗi 503")
+    args = parser.parse_args()
+    server = start(args.port, args.latency, token_rate=args.token_rate, failure_rate=args.failure_rate)
+    print(f">>> Fake Gemini: http://127.0.0.1:{server.server_address[1]} (trễ {args.latency}s, "
+          f"{args.token_rate or '∞'} token/s, lỗi {args.failure_rate:.0%})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
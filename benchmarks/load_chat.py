@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import fake_gemini
+
+# --- LOAD-TEST /api/chat: WORKER SYNC vs GEVENT ---
+# Dựng server Gemini giả (trễ cố định), chạy gunicorn thật với từng loại worker rồi bắn
+# nhiều request /api/chat đồng thời để so sánh throughput.
+#   python -m benchmarks.load_chat --requests 64 --concurrency 32 --latency 1.0
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _post(base, path, payload, cookie=None, timeout=120):
+    req = urllib.request.Request(base + path, data=json.dumps(payload).encode("utf-8"), method="POST",
+                                 headers={"Content-Type": "application/json"})
+    if cookie:
+        req.add_header("Cookie", cookie)
+    with urllib.request.urlopen(req, timeout=timeout) as res:
+        # Cookie session có cờ Secure nên tự gửi lại bằng header (chạy local qua http)
+        set_cookie = res.headers.get("Set-Cookie")
+        return res.status, json.loads(res.read()), set_cookie.split(";")[0] if set_cookie else None
+
+
+def _wait_ready(base, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base + "/ping", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn không khởi động được")
+
+
+def run(worker_class, args, gemini_url):
+    port = _free_port()
+    db_path = os.path.join(tempfile.mkdtemp(), "load.db")
+    env = dict(os.environ,
+               GUNICORN_WORKER_CLASS=worker_class,
+               WEB_CONCURRENCY=str(args.workers),
+               GEMINI_TRANSPORT="rest",
+               GEMINI_API_ENDPOINT=gemini_url,
+               GOOGLE_API_KEY="fake",
+               DATABASE_URL=f"sqlite:///{db_path}")
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app",
+                             "--bind", f"127.0.0.1:{port}", "--log-level", "warning"],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(base)
+        _post(base, "/api/register", {"username": "load", "password": "load"})
+        _, _, cookie = _post(base, "/api/login", {"username": "load", "password": "load"})
+
+        def one(i):
+            start = time.perf_counter()
+            try:
+                status, _, _ = _post(base, "/api/chat", {"message": f"Học phí ngành AI? #{i}"}, cookie)
+            except OSError:
+                status = 0
+            return status, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    ok = [lat for status, lat in results if status == 200]
+    ok.sort()
+    p50 = ok[len(ok) // 2] if ok else float("nan")
+    print(f"{worker_class:>7}: {len(ok)}/{len(results)} OK trong {elapsed:.2f}s "
+          f"-> {len(ok) / elapsed:.1f} req/s, p50 {p50:.2f}s")
+    return len(ok) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=1.0, help="Độ trễ của Gemini giả (giây)")
+    args = parser.parse_args()
+
+    gemini = fake_gemini.start(latency=args.latency)
+    gemini_url = f"http://127.0.0.1:{gemini.server_address[1]}"
+    print(f">>> {args.requests} request, {args.concurrency} đồng thời, {args.workers} worker, "
+          f"Gemini trễ {args.latency}s")
+    sync_rps = run("sync", args, gemini_url)
+    gevent_rps = run("gevent", args, gemini_url)
+    print(f">>> gevent nhanh gấp {gevent_rps / sync_rps:.1f} lần worker sync")
+
+
+if __name__ == "__main__":
+    main()
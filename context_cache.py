@@ -0,0 +1,164 @@
+import os
+import time
+import hashlib
+import datetime
+import threading
+from contextlib import contextmanager, nullcontext
+import google.generativeai as genai
+from upstream import RETRYABLE_ERRORS
+
+# --- GEMINI CONTEXT CACHING CHO PHẦN CHỈ THỊ CỐ ĐỊNH ---
+# context_instruction (quy tắc + dữ liệu) giống hệt nhau ở mọi request. Đăng ký nó một lần
+# làm CachedContent trên Gemini, các request sau chỉ tham chiếu tới cache thay vì gửi lại.
+# Cache được tạo lại khi hết TTL hoặc khi nội dung (hash dữ liệu) thay đổi. Nếu tạo cache
+# thất bại (nội dung quá ngắn, API không hỗ trợ...) thì dùng system_instruction thường.
+# Việc tạo lại chạy nền, mỗi lúc chỉ 1 lần và không giữ lock: trong lúc chờ, request vẫn dùng
+# cache cũ (nếu chưa hết hạn) hoặc system_instruction. CachedContent.create/list không nhận
+# timeout nên lần tạo quá REFRESH_DEADLINE bị bỏ (kết quả về muộn không được dùng).
+ENABLED = os.environ.get("GEMINI_CONTEXT_CACHE", "1") == "1"
+TTL_SECONDS = int(os.environ.get("GEMINI_CACHE_TTL", 3600))
+# Tạo lại trước khi hết hạn một chút để request không trúng cache vừa hết hạn
+REFRESH_MARGIN = 60
+# Tạo cache lỗi thì chờ một lúc mới thử lại, tránh mỗi request đều gọi API lỗi
+RETRY_AFTER = int(os.environ.get("GEMINI_CACHE_RETRY_AFTER", 600))
+REFRESH_DEADLINE = float(os.environ.get("GEMINI_CACHE_DEADLINE", 30))
+
+
+def spawn_thread(fn):
+    threading.Thread(target=fn, daemon=True).start()
+
+
+class ContextCacheManager:
+    def __init__(self, model_name, client=genai, enabled=ENABLED, ttl_seconds=TTL_SECONDS,
+                 limiter=None, breaker=None, deadline=REFRESH_DEADLINE, spawn=spawn_thread):
+        # client: module google.generativeai (hoặc stub có .caching và .GenerativeModel)
+        # limiter/breaker: của upstream.py, để lời gọi tạo cache cũng bị giới hạn như lời gọi chat
+        # spawn(fn): chạy việc tạo lại cache (mặc định 1 thread nền)
+        self.model_name = model_name
+        self.client = client
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.limiter = limiter
+        self.breaker = breaker
+        self.deadline = deadline
+        self.spawn = spawn
+        self._lock = threading.Lock()
+        self._key = None
+        self._model = None
+        self._cached = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._fallback = (None, None)
+        # Lần tạo lại đang chạy: (số thứ tự, thời điểm bắt đầu) hoặc None
+        self._refreshing = None
+        self._generation = 0
+        self.metrics = {"created": 0, "reused": 0, "expired": 0, "invalidated": 0, "fallback": 0, "errors": 0,
+                        "timeouts": 0}
+
+    @staticmethod
+    def key_for(system_instruction):
+        return hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()[:16]
+
+    def get_model(self, system_instruction):
+        key = self.key_for(system_instruction)
+        now = time.time()
+        with self._lock:
+            if self._key == key and self._cached is not None and now < self._expires_at - REFRESH_MARGIN:
+                self.metrics["reused"] += 1
+                return self._model
+            self._check_deadline(now)
+            generation = None
+            if self.enabled and self._refreshing is None and now >= self._retry_at:
+                if self._cached is not None:
+                    self.metrics["expired" if self._key == key else "invalidated"] += 1
+                self._generation += 1
+                generation = self._generation
+                self._refreshing = (generation, now)
+        if generation is not None:
+            self.spawn(lambda: self._refresh(generation, key, system_instruction))
+        with self._lock:
+            return self._serving_model(key, system_instruction)
+
+    def _serving_model(self, key, system_instruction):
+        # Cache cũ cùng nội dung còn hạn (đang trong REFRESH_MARGIN) thì dùng tiếp
+        if self._key == key and self._cached is not None and time.time() < self._expires_at:
+            self.metrics["reused"] += 1
+            return self._model
+        self.metrics["fallback"] += 1
+        fallback_key, model = self._fallback
+        if fallback_key != key:
+            model = self.client.GenerativeModel(self.model_name, system_instruction=system_instruction)
+            self._fallback = (key, model)
+        return model
+
+    def _check_deadline(self, now):
+        if self._refreshing is not None and now - self._refreshing[1] > self.deadline:
+            self._refreshing = None
+            self.metrics["errors"] += 1
+            self.metrics["timeouts"] += 1
+            self._retry_at = now + RETRY_AFTER
+            print(f">>> Tạo context cache quá {self.deadline:g}s, bỏ qua và dùng system_instruction")
+
+    @contextmanager
+    def _upstream(self):
+        if self.breaker is not None:
+            self.breaker.before_call()
+        with self.limiter.slot() if self.limiter is not None else nullcontext():
+            try:
+                yield
+            except RETRYABLE_ERRORS:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                raise
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def _refresh(self, generation, key, system_instruction):
+        # Chạy ngoài lock. Cache cũ không bị xóa: worker khác có thể vẫn đang dùng, để nó tự hết TTL
+        try:
+            with self._upstream():
+                cached = self._find_existing(key)
+                created = cached is None
+                if created:
+                    cached = self.client.caching.CachedContent.create(
+                        model=f"models/{self.model_name}",
+                        display_name=f"fitbot-{key}",
+                        system_instruction=system_instruction,
+                        ttl=datetime.timedelta(seconds=self.ttl_seconds),
+                    )
+            model = self.client.GenerativeModel.from_cached_content(cached)
+        except Exception as e:
+            with self._lock:
+                if self._refreshing is None or self._refreshing[0] != generation:
+                    return
+                self._refreshing = None
+                self.metrics["errors"] += 1
+                self._retry_at = time.time() + RETRY_AFTER
+            print(f">>> Không tạo được context cache, dùng system_instruction: {e}")
+            return
+
+        with self._lock:
+            if self._refreshing is None or self._refreshing[0] != generation:
+                # Đã quá hạn và bị bỏ, hoặc đã có lần tạo mới hơn
+                return
+            self._refreshing = None
+            self.metrics["created" if created else "reused"] += 1
+            self._key = key
+            self._cached = cached
+            self._expires_at = cached.expire_time.timestamp()
+            self._model = model
+        if created:
+            print(f">>> Đã tạo context cache Gemini {cached.name} (hết hạn {cached.expire_time})")
+
+    def _find_existing(self, key):
+        # Worker/instance khác có thể đã tạo cache cho cùng nội dung
+        display_name = f"fitbot-{key}"
+        for cached in self.client.caching.CachedContent.list(page_size=100):
+            if cached.display_name == display_name and \
+                    cached.expire_time.timestamp() > time.time() + REFRESH_MARGIN:
+                return cached
+        return None
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, active=self._cached is not None, refreshing=self._refreshing is not None)
@@ -0,0 +1,40 @@
+import os
+
+# --- CẤU HÌNH GUNICORN ---
+# Mặc định dùng worker gevent: mỗi process giữ hàng trăm request /api/chat đang chờ Gemini
+# thay vì 1 request/worker như worker sync. Đặt GUNICORN_WORKER_CLASS=sync để quay lại như cũ.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+# /metrics (metrics.py) đi chung cổng công khai với app nên được bảo vệ bằng token: đặt METRICS_TOKEN
+# và cấu hình Prometheus gửi "Authorization: Bearer <token>" (bearer_token trong scrape_config).
+# Không đặt METRICS_TOKEN thì /metrics luôn trả 401.
+
+if worker_class == "gevent":
+    try:
+        # Patch trước khi app được import (preload_app) để socket/ssl/threading đều cooperative
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        print(">>> Chưa cài gevent, dùng worker sync")
+        worker_class = "sync"
+
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Nạp app (và KNOWLEDGE_BASE) một lần ở master rồi fork: các worker dùng chung bộ nhớ
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Không dùng chung các connection DB mà master đã mở lúc preload
+    from app import app, db
+    with app.app_context():
+        # close=False: chỉ bỏ pool trong worker, không đóng socket vẫn thuộc về master
+        db.engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    # Chế độ multiprocess của Prometheus: bỏ số liệu gauge của worker đã tắt
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
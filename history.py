@@ -0,0 +1,117 @@
+import os
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+from message_store import message_body, message_format
+
+# --- LỊCH SỬ HỘI THOẠI CÓ GIỚI HẠN ---
+# Chỉ giữ nguyên văn N lượt gần nhất (trong ngân sách token); các lượt cũ hơn được gộp vào
+# bản ghi rút gọn (digest) lưu ở cột Conversation.summary. Nhờ vậy prompt mỗi lượt không phình ra
+# theo độ dài cuộc trò chuyện. Câu trả lời của bot được gửi lại dưới dạng markdown/text, không HTML.
+# Digest KHÔNG phải bản tóm tắt do model viết: mỗi lượt cũ giữ câu hỏi (cắt ngắn), câu mở đầu của
+# câu trả lời và các dòng có số liệu (điểm, học phí, mã ngành...), dòng cũ nhất bị bỏ khi quá dài.
+MAX_TURNS = int(os.environ.get("HISTORY_MAX_TURNS", 6))
+TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 2000))
+DIGEST_MAX_CHARS = int(os.environ.get("HISTORY_DIGEST_CHARS", 2000))
+# Giới hạn mỗi lượt cũ trong digest
+DIGEST_QUESTION_CHARS = 200
+DIGEST_ANSWER_CHARS = 400
+# Dòng có chữ số hoặc chữ in đậm là số liệu cần giữ
+_FACT_RE = re.compile(r"\d|\*\*")
+# Câu lưu ý cố định cuối câu trả lời, không mang thông tin của lượt đó
+_BOILERPLATE = ("*Lưu ý, đây chỉ là thông tin",)
+
+HistoryWindow = namedtuple("HistoryWindow", ["digest", "recent"])
+
+
+def estimate_tokens(text):
+    # Ước lượng thô ~4 ký tự/token, đủ để giữ prompt ổn định
+    return len(text) // 4 + 1
+
+
+class _TextExtractor(HTMLParser):
+    BREAKS = {"p", "br", "div", "ul", "ol", "h1", "h2", "h3", "h4", "table", "tr"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "li":
+            self.parts.append("\n- ")
+        elif tag in self.BREAKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def html_to_text(html):
+    if "<" not in html:
+        return html
+    parser = _TextExtractor()
+    parser.feed(html)
+    lines = [" ".join(line.split()) for line in "".join(parser.parts).split("\n")]
+    return "\n".join(line for line in lines if line)
+
+
+def message_text(msg):
+    # Tin cũ lưu HTML thì bỏ thẻ; markdown gốc gửi lại nguyên văn
+    body = message_body(msg)
+    return html_to_text(body) if message_format(msg) == "html" else body
+
+
+def _shorten(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + "..."
+
+
+def condense_answer(text, limit=DIGEST_ANSWER_CHARS):
+    # Câu mở đầu + các dòng có số liệu, thay vì chỉ lấy phần đầu (số liệu thường nằm ở cuối)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    lines = [line for line in lines if not line.startswith(_BOILERPLATE)]
+    if not lines:
+        return ""
+    picked = lines[:1] + [line for line in lines[1:] if _FACT_RE.search(line)]
+    return _shorten(" | ".join(picked).replace("**", ""), limit)
+
+
+class HistoryManager:
+    def __init__(self, max_turns=MAX_TURNS, token_budget=TOKEN_BUDGET, digest_max_chars=DIGEST_MAX_CHARS):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.digest_max_chars = digest_max_chars
+
+    def prepare(self, conv, messages):
+        # messages: các ChatMessage chưa được gộp vào digest (id > conv.summarized_until), theo thứ tự thời gian.
+        # Trả về HistoryWindow(digest, recent[(role, text)]) và cập nhật conv nếu có lượt bị gộp.
+        texts = [(m.role, message_text(m)) for m in messages]
+
+        # Đi ngược từ tin mới nhất, giữ tối đa max_turns lượt và không vượt ngân sách token
+        keep_from, used = len(texts), 0
+        for i in range(len(texts) - 1, -1, -1):
+            cost = estimate_tokens(texts[i][1])
+            if len(texts) - i > self.max_turns * 2 or used + cost > self.token_budget:
+                break
+            keep_from, used = i, used + cost
+        # Không tách rời câu hỏi khỏi câu trả lời của nó
+        if keep_from < len(texts) and texts[keep_from][0] != "user":
+            keep_from += 1
+
+        if keep_from > 0:
+            conv.summary = self._fold(conv.summary, texts[:keep_from])
+            conv.summarized_until = messages[keep_from - 1].id
+
+        return HistoryWindow(conv.summary or "", texts[keep_from:])
+
+    def _fold(self, digest, texts):
+        lines = digest.split("\n") if digest else []
+        for role, text in texts:
+            if role == "user":
+                lines.append(f"- Người dùng hỏi: {_shorten(text, DIGEST_QUESTION_CHARS)}")
+            else:
+                lines.append(f"  Bot đã trả lời (rút gọn): {condense_answer(text)}")
+        # Bỏ bớt các lượt cũ nhất khi digest quá dài
+        while lines and len("\n".join(lines)) > self.digest_max_chars:
+            lines.pop(0)
+        return "\n".join(lines)
@@ -0,0 +1,340 @@
+import os
+import io
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from docx import Document
+from pypdf import PdfReader
+
+# --- CACHE DỮ LIỆU ĐÃ TRÍCH XUẤT ---
+# Mỗi file trong data/ được lưu theo đường dẫn + kích thước + mtime + sha256.
+# Khởi động "ấm" chỉ cần đọc file JSON này, chỉ file nào thay đổi mới phải parse lại.
+CACHE_DIR = os.environ.get("KB_CACHE_DIR", ".kb_cache")
+CACHE_FILE = "extract_cache.json"
+# Tăng số này khi đổi cách trích xuất để cache cũ tự bị bỏ qua
+EXTRACTOR_VERSION = 2
+
+
+def file_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def knowledge_hash(text):
+    # Hash của toàn bộ KNOWLEDGE_BASE, dùng để biết dữ liệu đã đổi hay chưa
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ExtractionCache:
+    # cache_file/version: cũng dùng để cache bản ghi đã tách từ bảng (xem cached_parse)
+    def __init__(self, cache_dir=CACHE_DIR, cache_file=CACHE_FILE, version=EXTRACTOR_VERSION):
+        self.enabled = bool(cache_dir)
+        self.path = os.path.join(cache_dir, cache_file) if self.enabled else None
+        self.version = version
+        self.entries = {}
+        self.seen = set()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not self.enabled or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("version") == self.version:
+                self.entries = payload.get("files", {})
+        except (OSError, ValueError) as e:
+            print(f"   ⚠️ Cache hỏng, sẽ đọc lại toàn bộ: {e}")
+            self.entries = {}
+
+    @staticmethod
+    def key(full_path):
+        return os.path.normpath(full_path).replace(os.sep, "/")
+
+    def lookup(self, full_path, st):
+        key = self.key(full_path)
+        self.seen.add(key)
+        entry = self.entries.get(key)
+        if entry is None or entry["size"] != st.st_size:
+            self.misses += 1
+            return None
+        if entry["mtime_ns"] != st.st_mtime_ns:
+            # mtime đổi (vd: checkout lại repo) nhưng nội dung có thể vẫn vậy
+            with open(full_path, "rb") as f:
+                if file_sha256(f.read()) != entry["sha256"]:
+                    self.misses += 1
+                    return None
+            entry["mtime_ns"] = st.st_mtime_ns
+            self.dirty = True
+        self.hits += 1
+        return entry["text"]
+
+    def store(self, full_path, st, digest, text):
+        key = self.key(full_path)
+        self.seen.add(key)
+        self.entries[key] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": digest,
+            "text": text,
+        }
+        self.dirty = True
+
+    def prune(self, root):
+        # Xóa các file đã bị xóa khỏi data/
+        prefix = self.key(root) + "/"
+        for key in [k for k in self.entries if k.startswith(prefix) and k not in self.seen]:
+            del self.entries[key]
+            self.dirty = True
+
+    def save(self):
+        if not self.enabled or not self.dirty:
+            return
+        cache_dir = os.path.dirname(self.path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Ghi ra file tạm rồi os.replace để các worker khác không đọc phải file ghi dở
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "files": self.entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            print(f"   ⚠️ Không ghi được cache: {e}")
+
+
+def cached_parse(cache, full_path, parse):
+    # parse(bytes) -> giá trị JSON được (vd: bản ghi tách từ bảng). File không đổi thì lấy từ
+    # cache, không phải mở lại DOCX/PDF lúc khởi động hay nạp lại dữ liệu.
+    st = os.stat(full_path)
+    value = cache.lookup(full_path, st) if cache.enabled else None
+    if value is None:
+        with open(full_path, "rb") as f:
+            data = f.read()
+        value = parse(data)
+        if cache.enabled:
+            cache.store(full_path, st, file_sha256(data), value)
+    return value
+
+
+# --- TRÍCH XUẤT NỘI DUNG TỪNG FILE ---
+def table_rows(table):
+    # Mỗi hàng -> danh sách ô; ô gộp ngang bị python-docx lặp lại (cùng 1 phần tử <w:tc>) nên chỉ lấy 1 lần
+    rows = []
+    for row in table.rows:
+        cells, previous = [], None
+        for cell in row.cells:
+            if cell._tc is not previous:
+                cells.append(" ".join(cell.text.split()))
+            previous = cell._tc
+        if any(cells):
+            rows.append(cells)
+    return rows
+
+
+def extract_docx(data):
+    # Giữ đúng thứ tự đoạn văn và bảng trong file; doc.paragraphs bỏ mất toàn bộ bảng
+    doc = Document(io.BytesIO(data))
+    lines = []
+    for block in doc.iter_inner_content():
+        if hasattr(block, "rows"):
+            lines.extend(" | ".join(cells) for cells in table_rows(block))
+        elif block.text.strip() != '':
+            lines.append(block.text)
+    return "\n".join(lines)
+
+
+def extract_pdf(data):
+    reader = PdfReader(io.BytesIO(data))
+    pages = []
+    for page in reader.pages:
+        extracted = page.extract_text()
+        if extracted: pages.append(extracted + "\n")
+    return "".join(pages)
+
+
+EXTRACTORS = {".docx": ("Word", extract_docx), ".pdf": ("PDF", extract_pdf)}
+
+
+def extract_file(full_path, item, label):
+    # Chạy trong process con: đọc + trích xuất 1 file.
+    # Trả về (block, sha256, lỗi, số giây); lỗi không làm hỏng cả lượt đọc.
+    start = time.perf_counter()
+    extractor = EXTRACTORS[os.path.splitext(item.lower())[1]][1]
+    try:
+        with open(full_path, "rb") as f:
+            data = f.read()
+        text = extractor(data)
+        block = f"\n[Nguồn: File {label} {item}]\n{text}\n"
+        return block, file_sha256(data), None, time.perf_counter() - start
+    except Exception as e:
+        return "", None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+# --- ĐỌC CẢ THƯ MỤC: TÌM FILE -> TRÍCH XUẤT SONG SONG -> GHÉP THEO THỨ TỰ CỐ ĐỊNH ---
+# Số process trích xuất; 1 = đọc tuần tự ngay trong process hiện tại
+EXTRACT_WORKERS = int(os.environ.get("KB_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+# Ít file cần đọc mới hơn số này thì không đáng tạo process pool
+PARALLEL_MIN_FILES = 4
+
+
+def process_pool_available():
+    # Dưới gevent, process pool cần child watcher mà libev chỉ có ở event loop của thread chính.
+    # Nạp lại dữ liệu chạy trong threadpool của gevent (knowledge_reload.run_blocking) nên ở đó
+    # trích xuất tuần tự (thread đó không chặn request).
+    try:
+        from gevent import monkey
+        if not monkey.is_module_patched("os"):
+            return True
+        import gevent
+        return gevent.get_hub().loop.default
+    except ImportError:
+        return True
+
+
+def discover_files(path):
+    # Duyệt data/ theo thứ tự tên (ổn định giữa các máy), thư mục con nằm đúng chỗ của nó
+    # -> danh sách (đường dẫn, tên file, loại)
+    files = []
+    if not os.path.exists(path):
+        return files
+    for item in sorted(os.listdir(path)):
+        full_path = os.path.join(path, item)
+        if os.path.isdir(full_path):
+            print(f"📂 Đang vào folder: {item}...")
+            files.extend(discover_files(full_path))
+        elif os.path.isfile(full_path):
+            ext = os.path.splitext(item.lower())[1]
+            if ext == '.doc':
+                print(f"   ⚠️ BỎ QUA file .doc (Hãy đổi sang .docx): {item}")
+            elif ext in EXTRACTORS:
+                files.append((full_path, item, EXTRACTORS[ext][0]))
+    return files
+
+
+def extract_corpus(path, cache, workers=EXTRACT_WORKERS):
+    # Trả về (toàn bộ văn bản, báo cáo từng file)
+    # Báo cáo: {"file", "cached", "seconds", "chars", "error"}
+    files = discover_files(path)
+    blocks = [""] * len(files)
+    report = [None] * len(files)
+    pending = []
+    for i, (full_path, item, label) in enumerate(files):
+        st = os.stat(full_path)
+        cached = cache.lookup(full_path, st) if cache.enabled else None
+        if cached is not None:
+            blocks[i] = cached
+            report[i] = {"file": full_path, "cached": True, "seconds": 0.0, "chars": len(cached), "error": None}
+        else:
+            pending.append((i, st))
+
+    def done(i, st, result):
+        full_path, item, label = files[i]
+        block, digest, error, seconds = result
+        report[i] = {"file": full_path, "cached": False, "seconds": round(seconds, 4), "chars": len(block), "error": error}
+        if error:
+            print(f"   ❌ LỖI đọc file {label} {item}: {error}")
+            return
+        blocks[i] = block
+        print(f"   ✅ Đã đọc file {label}: {item} ({seconds:.2f}s)")
+        if cache.enabled:
+            cache.store(full_path, st, digest, block)
+
+    if workers > 1 and len(pending) >= PARALLEL_MIN_FILES and process_pool_available():
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            futures = {pool.submit(extract_file, *files[i]): (i, st) for i, st in pending}
+            # Ghi kết quả theo thứ tự xong trước, nhưng vẫn ghép theo thứ tự file ở dưới
+            for future in as_completed(futures):
+                i, st = futures[future]
+                done(i, st, future.result())
+    else:
+        for i, st in pending:
+            done(i, st, extract_file(*files[i]))
+
+    return "".join(blocks), report
+
+
+def print_report(report, slowest=3):
+    extracted = [r for r in report if not r["cached"]]
+    errors = [r for r in report if r["error"]]
+    total = sum(r["seconds"] for r in extracted)
+    print(f"   ⏱️ {len(report)} file: {len(report) - len(extracted)} từ cache, {len(extracted)} trích xuất "
+          f"({total:.2f}s tổng), {len(errors)} lỗi")
+    for r in sorted(extracted, key=lambda r: r["seconds"], reverse=True)[:slowest]:
+        print(f"      {r['seconds']:.2f}s  {r['file']}")
+
+
+def scan_data(path):
+    # Dấu vân tay rẻ của data/: {đường dẫn: (kích thước, mtime)} các file được đọc, không mở file
+    fingerprint = {}
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            if name.lower().endswith(('.docx', '.pdf', '.doc')):
+                full_path = os.path.join(root, name)
+                st = os.stat(full_path)
+                fingerprint[ExtractionCache.key(full_path)] = (st.st_size, st.st_mtime_ns)
+    return fingerprint
+
+
+def diff_scans(old, new):
+    return {
+        "added": sorted(k for k in new if k not in old),
+        "removed": sorted(k for k in old if k not in new),
+        "changed": sorted(k for k in new if k in old and new[k] != old[k]),
+    }
+
+
+def read_data_recursive(path, cache=None, workers=EXTRACT_WORKERS):
+    own_cache = cache is None
+    if own_cache:
+        cache = ExtractionCache()
+    combined_text, report = extract_corpus(path, cache, workers)
+    if own_cache:
+        cache.prune(path)
+        cache.save()
+        if cache.enabled:
+            print(f"   💾 Cache: {cache.hits} file dùng lại, {cache.misses} file đọc mới")
+    print_report(report)
+    return combined_text
+
+
+# --- CLI: build cache sẵn lúc build image ---
+# python knowledge.py build-cache [--data data] [--rebuild]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quản lý cache dữ liệu tuyển sinh")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build-cache", help="Trích xuất trước toàn bộ data/ vào cache")
+    build.add_argument("--data", default="data")
+    build.add_argument("--cache-dir", default=CACHE_DIR)
+    build.add_argument("--rebuild", action="store_true", help="Bỏ cache cũ, đọc lại từ đầu")
+    build.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="Số process trích xuất")
+    args = parser.parse_args(argv)
+
+    if args.command == "build-cache":
+        if not args.cache_dir:
+            parser.error("KB_CACHE_DIR đang rỗng (cache bị tắt)")
+        cache = ExtractionCache(args.cache_dir)
+        if args.rebuild:
+            cache.entries = {}
+        start = time.perf_counter()
+        text = read_data_recursive(args.data, cache, args.workers)
+        cache.prune(args.data)
+        cache.dirty = True
+        cache.save()
+        # Bảng điểm chuẩn / học phí / điểm cộng đã tách cũng được cache sẵn
+        from admission_tables import AdmissionTables
+        from scoring import ScoreEngine
+        AdmissionTables(cache_dir=args.cache_dir)
+        ScoreEngine(cache_dir=args.cache_dir)
+        elapsed = time.perf_counter() - start
+        print(f">>> Cache: {len(cache.entries)} file, {len(text)} ký tự, "
+              f"hash {knowledge_hash(text)}, {elapsed:.2f}s -> {cache.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import time
+import tempfile
+import threading
+from knowledge import CACHE_DIR, scan_data, diff_scans
+
+# --- NẠP LẠI DỮ LIỆU KHÔNG CẦN KHỞI ĐỘNG LẠI ---
+# Toàn bộ dữ liệu dẫn xuất (context_instruction, index tìm kiếm, bảng điểm cộng...) nằm trong
+# 1 snapshot bất biến. Nạp lại = dựng snapshot mới (chỉ file thay đổi bị parse lại nhờ
+# ExtractionCache và index tăng dần) rồi gán đè 1 lần; request đang chạy vẫn dùng snapshot cũ.
+# Đồng bộ giữa các worker gunicorn qua file đánh dấu chứa hash dữ liệu mới nhất: worker nào
+# thấy hash khác của mình thì tự nạp lại ở nền.
+DATA_DIR = "data"
+GENERATION_FILE = os.environ.get("KB_GENERATION_FILE", os.path.join(CACHE_DIR or ".", "kb_generation"))
+# Bao lâu mỗi worker xem lại file đánh dấu (giây)
+CHECK_INTERVAL = float(os.environ.get("KB_CHECK_INTERVAL", 5))
+# > 0: tự quét data/ theo chu kỳ này (giây) và nạp lại khi có file thay đổi
+WATCH_INTERVAL = float(os.environ.get("KB_WATCH_INTERVAL", 0))
+
+
+def run_blocking(fn):
+    # Worker gevent: threading.Thread đã bị patch thành greenlet, việc nặng CPU (parse file,
+    # dựng index) chạy trong đó vẫn chặn event loop và mọi request của worker. Chạy fn trong
+    # threadpool thật của gevent; greenlet gọi chờ kết quả, các greenlet khác vẫn chạy.
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched("threading"):
+            import gevent
+            return gevent.get_hub().threadpool.apply(fn)
+    except ImportError:
+        pass
+    return fn()
+
+
+class KnowledgeReloader:
+    def __init__(self, build_state, data_dir=DATA_DIR, generation_file=GENERATION_FILE,
+                 check_interval=CHECK_INTERVAL, watch_interval=WATCH_INTERVAL):
+        # build_state(): đọc data_dir và trả về snapshot có thuộc tính knowledge_hash
+        self.build_state = build_state
+        self.data_dir = data_dir
+        self.generation_file = generation_file
+        self.check_interval = check_interval
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._next_check = 0.0
+        self._next_watch = 0.0
+        # Hash trong file đánh dấu mà nạp lại xong vẫn không khớp (dữ liệu đã đổi tiếp) thì không thử lại
+        self._stale_published = None
+        self.scan = scan_data(data_dir)
+        self.state = build_state()
+        self.metrics = {"reloads": 0, "errors": 0, "last_seconds": 0.0}
+
+    def reload(self, reason="manual"):
+        # Trả về thống kê lần nạp lại; None nếu đang có lần nạp lại khác chạy
+        with self._lock:
+            if self._reloading:
+                return None
+            self._reloading = True
+        try:
+            start = time.perf_counter()
+            scan = scan_data(self.data_dir)
+            changes = diff_scans(self.scan, scan)
+            old_hash = self.state.knowledge_hash
+            state = run_blocking(self.build_state)
+            # Gán đè 1 lần: request mới thấy toàn bộ dữ liệu mới, request cũ giữ snapshot cũ
+            self.state, self.scan = state, scan
+            elapsed = time.perf_counter() - start
+            self.metrics["reloads"] += 1
+            self.metrics["last_seconds"] = round(elapsed, 3)
+            print(f">>> Nạp lại dữ liệu ({reason}): {len(changes['added'])} thêm, {len(changes['changed'])} sửa, "
+                  f"{len(changes['removed'])} xóa, hash {old_hash} -> {state.knowledge_hash} trong {elapsed:.2f}s")
+            return dict(changes, knowledge_hash=state.knowledge_hash, previous_hash=old_hash, seconds=round(elapsed, 3))
+        except Exception as e:
+            self.metrics["errors"] += 1
+            print(f"   ❌ LỖI nạp lại dữ liệu, giữ dữ liệu cũ: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def publish(self):
+        # Báo cho các worker khác hash dữ liệu mới nhất (ghi file tạm rồi os.replace)
+        directory = os.path.dirname(self.generation_file) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.state.knowledge_hash)
+            os.replace(tmp_path, self.generation_file)
+        except OSError as e:
+            print(f"   ⚠️ Không ghi được file đánh dấu dữ liệu: {e}")
+
+    def _published_hash(self):
+        try:
+            with open(self.generation_file, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def maybe_reload(self):
+        # Gọi ở mỗi request; thực sự kiểm tra tối đa 1 lần mỗi check_interval giây.
+        # Việc nạp lại chạy ở thread nền nên request hiện tại không phải chờ.
+        now = time.time()
+        if now < self._next_check or self._reloading:
+            return
+        self._next_check = now + self.check_interval
+
+        reason = None
+        published = self._published_hash()
+        if published and published not in (self.state.knowledge_hash, self._stale_published):
+            reason = "worker khác đã nạp dữ liệu mới"
+        elif self.watch_interval > 0 and now >= self._next_watch:
+            self._next_watch = now + self.watch_interval
+            if scan_data(self.data_dir) != self.scan:
+                reason = "phát hiện file thay đổi"
+        if reason:
+            threading.Thread(target=self._reload_in_background, args=(reason, published), daemon=True).start()
+
+    def _reload_in_background(self, reason, published):
+        try:
+            result = self.reload(reason)
+        except Exception:
+            return
+        if result is None:
+            return
+        if reason == "phát hiện file thay đổi":
+            self.publish()
+        elif result["knowledge_hash"] != published:
+            self._stale_published = published
+
+    def stats(self):
+        return dict(self.metrics, files=len(self.scan), reloading=self._reloading)
@@ -0,0 +1,92 @@
+import os
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+import markdown
+
+# --- LƯU TIN NHẮN GỌN: MARKDOWN GỐC, NÉN KHI DÀI, RENDER 1 LẦN ---
+# Câu trả lời của bot được lưu nguyên văn markdown (format "md") thay vì HTML đã render:
+# nhỏ hơn, gửi lại cho Gemini làm lịch sử không tốn token cho thẻ HTML. Tin dài được nén zlib
+# vào cột packed (content để rỗng). HTML cho client lấy từ RenderCache theo hash nội dung.
+# Dữ liệu cũ: format "html" (bot) / "text" (user), vẫn đọc được như trước.
+#   ChatMessage.format: "text" | "md" | "html" (None = dòng ghi trước migration 0003)
+COMPRESS_MIN_BYTES = int(os.environ.get("MESSAGE_COMPRESS_MIN_BYTES", 1024))  # 0 = không nén
+# Chỉ giữ bản nén nếu nhỏ hơn bản gốc ít nhất 10%
+COMPRESS_MIN_SAVING = 0.9
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", 2000))
+
+
+def render_markdown(text):
+    return markdown.markdown(text, extensions=['extra', 'nl2br', 'sane_lists'])
+
+
+def pack(text):
+    # -> (content, packed): text giữ nguyên, hoặc ("", bản nén zlib)
+    raw = text.encode("utf-8")
+    if COMPRESS_MIN_BYTES and len(raw) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw) * COMPRESS_MIN_SAVING:
+            return "", packed
+    return text, None
+
+
+def message_fields(role, text):
+    # Các cột của ChatMessage cho 1 tin mới
+    content, packed = pack(text)
+    return {"role": role, "content": content, "packed": packed, "format": "text" if role == "user" else "md"}
+
+
+def message_format(msg):
+    if msg.format:
+        return msg.format
+    return "text" if msg.role == "user" else "html"
+
+
+def message_body(msg):
+    # Nội dung đã lưu (markdown/HTML/text tùy format), giải nén nếu cần
+    if msg.packed is not None:
+        return zlib.decompress(msg.packed).decode("utf-8")
+    return msg.content
+
+
+class RenderCache:
+    # LRU: hash(markdown) -> HTML. Câu trả lời lặp lại (cache câu trả lời, bảng tra cứu) và
+    # các lần mở lại hội thoại không phải render lại.
+    def __init__(self, max_entries=RENDER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text):
+        key = hashlib.sha1(text.encode("utf-8")).digest()
+        with self._lock:
+            html = self._data.get(key)
+            if html is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        html = render_markdown(text)
+        with self._lock:
+            self._data[key] = html
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return html
+
+    def message_html(self, msg):
+        # Nội dung trả về cho client (giống định dạng cũ: bot là HTML, user là text)
+        body = message_body(msg)
+        return self.render(body) if message_format(msg) == "md" else body
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "entries": len(self._data),
+            }
@@ -0,0 +1,150 @@
+import os
+import time
+from contextlib import contextmanager
+from flask import g, request, Response, has_request_context
+from prometheus_client import (Counter, Histogram, CollectorRegistry, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+
+# --- ĐO THỜI GIAN TỪNG BƯỚC VÀ METRICS PROMETHEUS ---
+# Mỗi request có các "span" (conversation, history, prompt, queue, gemini, render, commit...)
+# ghi vào g.spans. Khi request xong: ghi histogram theo route/bước, trả header Server-Timing
+# và in log nếu chậm hơn SLOW_REQUEST_MS. /metrics xuất mọi thứ theo định dạng Prometheus.
+# Chạy nhiều worker gunicorn: đặt PROMETHEUS_MULTIPROC_DIR để /metrics cộng dồn mọi worker.
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 0))  # 0 = tắt log request chậm
+# /metrics cần header Authorization: Bearer <METRICS_TOKEN>; không đặt token thì /metrics luôn bị từ chối
+# (thời gian từng bước, lỗi Gemini... không được lộ ra ngoài ở bản deploy mặc định)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+REQUEST_SECONDS = Histogram("fitbot_request_seconds", "Thời gian xử lý request",
+                            ["route", "method", "status"], buckets=_BUCKETS)
+STAGE_SECONDS = Histogram("fitbot_stage_seconds", "Thời gian từng bước trong request",
+                          ["route", "stage"], buckets=_BUCKETS)
+STAGE_ERRORS = Counter("fitbot_stage_errors_total", "Số lần 1 bước bị lỗi", ["route", "stage", "error"])
+UPSTREAM_ERRORS = Counter("fitbot_upstream_errors_total", "Lỗi khi gọi Gemini", ["error"])
+UPSTREAM_RETRIES = Counter("fitbot_upstream_retries_total", "Số lần gọi lại Gemini sau lỗi tạm thời")
+TOKENS = Counter("fitbot_gemini_tokens_total", "Token Gemini theo usage_metadata", ["kind"])
+SLOW_REQUESTS = Counter("fitbot_slow_requests_total", "Số request chậm hơn SLOW_REQUEST_MS", ["route"])
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def record_span(stage, seconds):
+    if not has_request_context():
+        return
+    spans = g.setdefault("spans", {})
+    spans[stage] = spans.get(stage, 0.0) + seconds
+    STAGE_SECONDS.labels(_route(), stage).observe(seconds)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        # Ghi lại bước bị lỗi để log không chỉ còn "Hệ thống đang quá tải"
+        if has_request_context() and "failed_stage" not in g:
+            g.failed_stage = stage
+            STAGE_ERRORS.labels(_route(), stage, type(e).__name__).inc()
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+def record_usage(response):
+    # usage_metadata có ở response thường và ở chunk cuối khi stream
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"),
+                        ("cached", "cached_content_token_count")):
+        count = getattr(usage, field, 0) or 0
+        if count:
+            TOKENS.labels(kind).inc(count)
+
+
+def record_upstream_error(error):
+    UPSTREAM_ERRORS.labels(type(error).__name__).inc()
+
+
+def failed_stage():
+    return g.get("failed_stage", "unknown")
+
+
+def _server_timing(spans):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in spans.items())
+
+
+def _finish(route, method, status, start, spans):
+    elapsed = time.perf_counter() - start
+    REQUEST_SECONDS.labels(route, method, status).observe(elapsed)
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        SLOW_REQUESTS.labels(route).inc()
+        detail = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in spans.items())
+        print(f">>> Request chậm {method} {route} -> {status} trong {elapsed * 1000:.0f}ms ({detail or 'không có span'})")
+
+
+# Các số liệu stats() là giá trị tức thời (còn lại là bộ đếm tăng dần)
+GAUGE_KEYS = {"in_flight", "waiting", "entries", "hit_ratio", "active", "files", "reloading", "last_seconds",
+              "breaker_open", "consecutive_failures", "in_flight_keys", "refreshing"}
+
+
+class StatsCollector:
+    # Xuất stats() sẵn có của các thành phần (số liệu của process đang trả lời /metrics)
+    def __init__(self, sources):
+        self.sources = sources  # {tên: hàm trả về dict số}
+
+    def collect(self):
+        for name, stats in self.sources.items():
+            for key, value in stats().items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                metric_name = f"fitbot_{name}_{key}"
+                if key in GAUGE_KEYS:
+                    yield GaugeMetricFamily(metric_name, f"{name} {key}", value=value)
+                else:
+                    yield CounterMetricFamily(metric_name, f"{name} {key}", value=value)
+
+
+def init_app(app, sources):
+    REGISTRY.register(StatsCollector(sources))
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+        g.spans = {}
+
+    @app.after_request
+    def _record_request(response):
+        if "request_start" not in g:
+            return response
+        args = (_route(), request.method, str(response.status_code), g.request_start, g.spans)
+        if response.is_streamed:
+            # Response stream: chỉ đo xong khi đã gửi hết dữ liệu cho client
+            response.call_on_close(lambda: _finish(*args))
+        else:
+            response.headers["Server-Timing"] = _server_timing(g.spans)
+            _finish(*args)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        if not METRICS_TOKEN or request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            return "Unauthorized", 401
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            # Số liệu stats() không nằm trong file multiprocess, thêm trực tiếp
+            registry.register(StatsCollector(sources))
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
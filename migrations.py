@@ -0,0 +1,82 @@
+from sqlalchemy import inspect, text
+from message_store import pack
+
+# --- NÂNG CẤP SCHEMA DATABASE ---
+# db.create_all() chỉ tạo bảng còn thiếu, không thêm cột/index vào bảng đã có trên
+# PostgreSQL đang chạy. Mỗi migration chạy đúng 1 lần, ghi lại trong bảng schema_migrations.
+
+
+def add_column(table, column, ddl):
+    # ddl: kiểu cột, hoặc {tên dialect: kiểu cột} khi SQLite và PostgreSQL khác nhau
+    def apply(conn):
+        columns = {c["name"] for c in inspect(conn).get_columns(table)}
+        if column not in columns:
+            column_ddl = ddl.get(conn.dialect.name, ddl["default"]) if isinstance(ddl, dict) else ddl
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {column_ddl}'))
+    return apply
+
+
+def create_index(name, table, columns):
+    # IF NOT EXISTS: db.create_all() đã tạo index này trên database mới
+    def apply(conn):
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'))
+    return apply
+
+
+def compress_messages(batch_size=500):
+    # Nén các tin dài đã lưu trước đó (giữ nguyên format), duyệt theo id từng lô
+    def apply(conn):
+        last_id = 0
+        while True:
+            rows = conn.execute(text(
+                "SELECT id, content FROM chat_message WHERE id > :last_id AND packed IS NULL "
+                "ORDER BY id LIMIT :limit"), {"last_id": last_id, "limit": batch_size}).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = []
+            for row_id, content in rows:
+                content, packed = pack(content)
+                if packed is not None:
+                    updates.append({"id": row_id, "packed": packed})
+            if updates:
+                conn.execute(text("UPDATE chat_message SET content = '', packed = :packed WHERE id = :id"), updates)
+    return apply
+
+
+MIGRATIONS = [
+    ("0001_conversation_summary", [
+        add_column("conversation", "summary", "TEXT"),
+        add_column("conversation", "summarized_until", "INTEGER"),
+    ]),
+    # Danh sách hội thoại lọc theo user, tin nhắn lọc theo hội thoại, cả hai sắp theo thời gian
+    ("0002_history_indexes", [
+        create_index("ix_conversation_user_timestamp", "conversation", ["user_id", "timestamp"]),
+        create_index("ix_chat_message_conversation_timestamp", "chat_message", ["conversation_id", "timestamp"]),
+    ]),
+    # Tin nhắn lưu markdown gốc (nén nếu dài); các dòng cũ được đánh dấu html/text và nén lại
+    ("0003_message_format", [
+        add_column("chat_message", "format", "VARCHAR(10)"),
+        add_column("chat_message", "packed", {"postgresql": "BYTEA", "default": "BLOB"}),
+        lambda conn: conn.execute(text(
+            "UPDATE chat_message SET format = CASE WHEN role = 'user' THEN 'text' ELSE 'html' END "
+            "WHERE format IS NULL")),
+        compress_messages(),
+    ]),
+]
+
+
+def run_migrations(db):
+    with db.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (id VARCHAR(100) PRIMARY KEY)"))
+        applied = {row[0] for row in conn.execute(text("SELECT id FROM schema_migrations"))}
+
+    for migration_id, steps in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        # Mỗi migration một transaction: lỗi giữa chừng thì rollback cả migration
+        with db.engine.begin() as conn:
+            for step in steps:
+                step(conn)
+            conn.execute(text("INSERT INTO schema_migrations (id) VALUES (:id)"), {"id": migration_id})
+        print(f">>> Đã chạy migration {migration_id}")
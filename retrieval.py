@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import math
+import hashlib
+import tempfile
+from collections import Counter, defaultdict
+from textnorm import tokenize
+from knowledge import CACHE_DIR
+
+# --- TÌM KIẾM NGỮ CẢNH (BM25) ---
+# Thay vì nhét cả KNOWLEDGE_BASE vào prompt, chia dữ liệu thành các đoạn nhỏ (giữ nguyên
+# thẻ [Nguồn: ...]) và chỉ gửi top-k đoạn liên quan nhất tới câu hỏi cho Gemini.
+INDEX_FILE = "retrieval_index.json"
+INDEX_VERSION = 1
+CHUNK_CHARS = int(os.environ.get("RETRIEVAL_CHUNK_CHARS", 1000))
+TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 8))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_SOURCE_RE = re.compile(r"^\[Nguồn: [^\]]+\]$", re.MULTILINE)
+
+
+def split_sources(knowledge_text):
+    # Tách KNOWLEDGE_BASE theo các thẻ [Nguồn: ...] do read_data_recursive chèn vào
+    tags = list(_SOURCE_RE.finditer(knowledge_text))
+    sources = []
+    for i, m in enumerate(tags):
+        end = tags[i + 1].start() if i + 1 < len(tags) else len(knowledge_text)
+        sources.append((m.group(0), knowledge_text[m.end():end].strip()))
+    return sources
+
+
+def chunk_source(tag, body, chunk_chars=CHUNK_CHARS):
+    lines = [l for l in body.split("\n") if l.strip()]
+    chunks, current, size = [], [], 0
+    for line in lines:
+        if current and size + len(line) > chunk_chars:
+            chunks.append(current)
+            # Gối đầu 1 dòng để không cắt rời tiêu đề khỏi nội dung của nó
+            current, size = current[-1:], len(current[-1])
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append(current)
+    return [f"{tag}\n" + "\n".join(c) for c in chunks]
+
+
+def _source_hash(body):
+    return hashlib.sha256(f"{CHUNK_CHARS}:{body}".encode("utf-8")).hexdigest()[:16]
+
+
+class RetrievalIndex:
+    def __init__(self, chunks):
+        # chunks: list[{"text", "tf", "length"}], theo đúng thứ tự trong KNOWLEDGE_BASE
+        self.chunks = chunks
+        self.avgdl = (sum(c["length"] for c in chunks) / len(chunks)) if chunks else 0.0
+        self.postings = defaultdict(list)
+        for i, c in enumerate(chunks):
+            for term, freq in c["tf"].items():
+                self.postings[term].append((i, freq))
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    @classmethod
+    def build(cls, knowledge_text, cache_dir=CACHE_DIR):
+        # Dựng lại theo từng nguồn: nguồn nào không đổi thì dùng lại các đoạn đã token hóa
+        path = os.path.join(cache_dir, INDEX_FILE) if cache_dir else None
+        old_sources = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    payload = json.load(f)
+                if payload.get("version") == INDEX_VERSION:
+                    old_sources = payload.get("sources", {})
+            except (OSError, ValueError):
+                old_sources = {}
+
+        sources, chunks, reused = {}, [], 0
+        seen = Counter()
+        for tag, body in split_sources(knowledge_text):
+            seen[tag] += 1
+            key = tag if seen[tag] == 1 else f"{tag}#{seen[tag]}"
+            digest = _source_hash(body)
+            old = old_sources.get(key)
+            if old and old["hash"] == digest:
+                entry = old
+                reused += 1
+            else:
+                entry = {"hash": digest, "chunks": []}
+                for text in chunk_source(tag, body):
+                    terms = tokenize(text)
+                    entry["chunks"].append({"text": text, "tf": dict(Counter(terms)), "length": len(terms)})
+            sources[key] = entry
+            chunks.extend(entry["chunks"])
+
+        if path and (reused != len(sources) or len(sources) != len(old_sources)):
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"version": INDEX_VERSION, "sources": sources}, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"   ⚠️ Không ghi được index: {e}")
+        print(f"   🔎 Index: {len(chunks)} đoạn từ {len(sources)} nguồn ({reused} nguồn dùng lại)")
+        return cls(chunks)
+
+    def search(self, query, top_k=TOP_K):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, freq in self.postings[term]:
+                dl = self.chunks[i]["length"]
+                norm = freq + BM25_K1 * (1 - BM25_B + BM25_B * dl / self.avgdl)
+                scores[i] += idf * freq * (BM25_K1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        return [(score, i) for i, score in ranked]
+
+    def context_for(self, query, top_k=TOP_K):
+        hits = self.search(query, top_k)
+        # Giữ thứ tự gốc của tài liệu để đoạn văn đọc liền mạch
+        return "\n\n".join(self.chunks[i]["text"] for _, i in sorted(hits, key=lambda h: h[1]))
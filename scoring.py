@@ -0,0 +1,339 @@
+import io
+import os
+import re
+from docx import Document
+from knowledge import CACHE_DIR, ExtractionCache, cached_parse
+from textnorm import normalize
+
+# --- TÍNH ĐIỂM XÉT TUYỂN (KHÔNG QUA GEMINI) ---
+# Cài đặt đúng mục 1 của context_instruction:
+#   - Phương thức 2 (thang 30): ĐC = điểm cộng cơ sở nếu tổng < 28,
+#     ngược lại ĐC = [(30 - tổng) / 2] * điểm cộng cơ sở.
+#   - Phương thức 3 (ĐGNL, thang 1200): điểm cộng cơ sở x40, ngưỡng 1120,
+#     ĐC = [(1200 - tổng) / 80] * điểm cộng cơ sở (Phụ lục 4.3).
+#   - Điểm ưu tiên khu vực giảm dần khi tổng đạt được (tổng + ĐC) từ 22,5 trở lên:
+#     ĐUT = [(30 - tổng đạt được) / 7,5] * mức ưu tiên; thang 1200: ngưỡng 900, chia 300
+#     ("Cách thức tính điểm xét tuyển" trong Phụ lục).
+#   - Điểm xét = tổng + ĐC + ĐUT, không vượt quá điểm tối đa, làm tròn 2 chữ số.
+# Bảng điểm cộng cơ sở đọc từ Phụ lục 4.2 / 4.3 trong data/.
+BONUS_FILES = {
+    2: "data/Phụ lục/Phụ Lục 4.2 - Điểm Cộng Phương Thức 2.docx",
+    3: "data/Phụ lục/Phụ Lục 4.3 - Điểm Cộng Phương Thức 3.docx",
+}
+# Bảng điểm cộng đã tách được cache theo sha256 của file Phụ lục (xem knowledge.cached_parse)
+BONUS_CACHE_FILE = "bonus_cache.json"
+# Tăng số này khi đổi cách đọc bảng điểm cộng để cache cũ tự bị bỏ qua
+BONUS_PARSER_VERSION = 1
+
+METHODS = {
+    # phương thức: (điểm tối đa, ngưỡng giảm trừ, hệ số chia, hệ số quy đổi điểm cộng cơ sở)
+    2: (30.0, 28.0, 2.0, 1.0),
+    3: (1200.0, 1120.0, 80.0, 40.0),
+}
+
+PRIORITY_RULES = {
+    # phương thức: (ngưỡng giảm điểm ưu tiên, hệ số chia)
+    2: (22.5, 7.5),
+    3: (900.0, 300.0),
+}
+
+# Câu lưu ý cuối các câu trả lời dựa trên dữ liệu tuyển sinh 2025 (mục 5 của context_instruction)
+NOTE_2025 = ("*Lưu ý, đây chỉ là thông tin của kì tuyển sinh năm 2025. Thí sinh cần phải cập nhật thông tin "
+             "tuyển sinh năm 2026 khi có thông báo từ ĐHQG-HCM và nhà trường.*")
+
+# Điểm ưu tiên khu vực theo quy định của Bộ GDĐT (thang 30)
+REGION_PRIORITY = {"kv1": 0.75, "kv2-nt": 0.5, "kv2": 0.25, "kv3": 0.0}
+
+# Các loại cuộc thi, nhận diện từ mô tả giải thưởng (đã bỏ dấu), xét theo thứ tự.
+# Không dùng "tinh" đứng một mình: bỏ dấu thì "tỉnh" và "tính (điểm)" trùng nhau.
+COMPETITIONS = [
+    ("khkt_tinh", ("khoa hoc, ky thuat cap tinh", "khoa hoc ky thuat cap tinh", "khkt cap tinh", "khkt tinh")),
+    ("khkt_quoc_gia", ("khoa hoc, ky thuat cap quoc gia", "khoa hoc ky thuat cap quoc gia", "khkt quoc gia", "khkt")),
+    ("icpc", ("icpc",)),
+    ("olympic_30_4", ("olympic 30/4", "olympic 30-4", "30/4", "30-4")),
+    ("hsg_quoc_gia", ("hoc sinh gioi quoc gia", "quoc gia", "quoc te", "hsg qg", "hsgqg")),
+    ("hsg_tinh", ("hoc sinh gioi cap tinh", "hoc sinh gioi tinh", "hsg cap tinh", "hsg tinh", "cap tinh",
+                  "cap thanh pho", "hsg thanh pho", "giai tinh", "nhat tinh", "nhi tinh", "ba tinh")),
+]
+
+PRIZES = [
+    ("khuyen_khich", ("khuyen khich", "kk")),
+    ("vo_dich", ("vo dich",)),
+    ("nhat", ("nhat",)),
+    ("nhi", ("nhi",)),
+    ("ba", ("ba",)),
+    ("tu", ("tu",)),
+    ("vang", ("vang", "hcv")),
+    ("bac", ("bac", "hcb")),
+    ("dong", ("dong", "hcd")),
+]
+
+_GROUP_RE = re.compile(r"^nhom \d+: muc (?:cong|diem co so) ([\d,\.]+)")
+_PRIZE_SPAN_RE = re.compile(r"(?:doat giai|dat huy chuong|giai) (.+?)(?: trong | doi voi |$)")
+
+
+class ScoringError(ValueError):
+    pass
+
+
+def _match(text, table):
+    for code, keywords in table:
+        if any(re.search(rf"(?<!\w){re.escape(k)}(?!\w)", text) for k in keywords):
+            return code
+    return None
+
+
+def classify_award(text):
+    # "giải nhì HSG tỉnh" -> ("hsg_tinh", ["nhi"])
+    text = normalize(text)
+    competition = _match(text, COMPETITIONS)
+    span = _PRIZE_SPAN_RE.search(text)
+    prize_text = span.group(1) if span else text
+    prizes = []
+    for part in re.split(r",| va ", prize_text):
+        code = _match(part.strip(), PRIZES)
+        if code and code not in prizes:
+            prizes.append(code)
+    return competition, prizes
+
+
+def parse_bonus_table(data):
+    # Đọc "Nhóm N: Mức cộng X,XX điểm" và các dòng mô tả giải bên dưới
+    # -> [(cuộc thi, giải, điểm cộng cơ sở thang 30)], giải gặp trước được giữ
+    rows = []
+    seen = set()
+    base = None
+    for para in Document(io.BytesIO(data)).paragraphs:
+        line = normalize(para.text.strip())
+        if not line:
+            continue
+        group = _GROUP_RE.match(line)
+        if group:
+            base = float(group.group(1).replace(",", "."))
+            continue
+        if base is None or not line.startswith("thi sinh"):
+            continue
+        competition, prizes = classify_award(line)
+        for prize in prizes:
+            if competition and (competition, prize) not in seen:
+                seen.add((competition, prize))
+                rows.append((competition, prize, base))
+    return rows
+
+
+class ScoreEngine:
+    def __init__(self, bonus_files=BONUS_FILES, cache_dir=CACHE_DIR):
+        self.bonus_tables = {}
+        cache = ExtractionCache(cache_dir, BONUS_CACHE_FILE, BONUS_PARSER_VERSION)
+        for method, path in bonus_files.items():
+            self.bonus_tables[method] = {}
+            if not os.path.exists(path):
+                continue
+            try:
+                rows = cached_parse(cache, path, parse_bonus_table)
+                self.bonus_tables[method] = {(competition, prize): base for competition, prize, base in rows}
+            except Exception as e:
+                print(f"   ❌ LỖI đọc bảng điểm cộng {path}: {e}")
+        cache.save()
+
+    def bonus_base(self, method, competition, prize):
+        table = self.bonus_tables.get(method, {})
+        if (competition, prize) not in table:
+            raise ScoringError(f"Không tìm thấy điểm cộng cho giải '{prize}' của '{competition}'")
+        return table[(competition, prize)]
+
+    def score(self, candidate):
+        if not isinstance(candidate, dict):
+            raise ScoringError("Mỗi thí sinh phải là một object JSON")
+        award = candidate.get("award")
+        if award and not isinstance(award, (str, dict)):
+            raise ScoringError("award phải là chuỗi mô tả giải hoặc object {competition, prize}")
+        method = int(candidate.get("method", 2))
+        if method not in METHODS:
+            raise ScoringError("Chỉ hỗ trợ phương thức 2 (THPT) và 3 (ĐGNL)")
+        max_score, threshold, divisor, scale = METHODS[method]
+
+        if candidate.get("total") is not None:
+            total = float(candidate["total"])
+        elif candidate.get("scores"):
+            total = sum(float(s) for s in candidate["scores"])
+        else:
+            raise ScoringError("Thiếu tổng điểm thi (total) hoặc điểm từng môn (scores)")
+        if not 0 <= total <= max_score:
+            raise ScoringError(f"Tổng điểm phải nằm trong khoảng 0 - {max_score:g}")
+
+        if candidate.get("bonus_base") is not None:
+            base = float(candidate["bonus_base"])
+        elif award:
+            if isinstance(award, str):
+                competition, prizes = classify_award(award)
+                if not competition or not prizes:
+                    raise ScoringError(f"Không nhận diện được giải thưởng: {award}")
+                # Nhiều giải thì chỉ lấy mức cao nhất
+                base = max(self.bonus_base(method, competition, p) for p in prizes)
+            else:
+                base = self.bonus_base(method, award.get("competition"), award.get("prize"))
+        else:
+            base = 0.0
+        base_scaled = base * scale
+
+        if total < threshold:
+            bonus = base_scaled
+        else:
+            bonus = (max_score - total) / divisor * base_scaled
+
+        priority_level = candidate.get("priority", 0) or 0
+        if isinstance(priority_level, str):
+            key = priority_level.strip().lower().replace(" ", "")
+            if key not in REGION_PRIORITY:
+                raise ScoringError(f"Không rõ khu vực ưu tiên: {priority_level}")
+            priority_level = REGION_PRIORITY[key] * scale
+        priority_level = float(priority_level)
+
+        achieved = total + bonus
+        priority_threshold, priority_divisor = PRIORITY_RULES[method]
+        if achieved < priority_threshold:
+            priority = priority_level
+        else:
+            priority = max(0.0, (max_score - achieved) / priority_divisor * priority_level)
+
+        raw = achieved + priority
+        final = round(min(raw, max_score), 2)
+        return {
+            "method": method,
+            "total": round(total, 4),
+            "bonus_base": base,
+            "bonus_base_scaled": round(base_scaled, 4),
+            "reduced": total >= threshold,
+            "bonus": round(bonus, 4),
+            "priority_level": round(priority_level, 4),
+            "priority_reduced": bool(priority_level) and achieved >= priority_threshold,
+            "priority": round(priority, 4),
+            "capped": raw > max_score,
+            "final": final,
+        }
+
+    def score_many(self, candidates):
+        # Chấm cả lô một lần: bảng điểm cộng đã nạp sẵn, mỗi thí sinh chỉ còn vài phép tính
+        results = []
+        for candidate in candidates:
+            try:
+                results.append({"success": True, **self.score(candidate)})
+            except (ScoringError, TypeError, ValueError) as e:
+                results.append({"success": False, "message": str(e)})
+        return results
+
+
+# --- NHẬN DIỆN CÂU HỎI TÍNH ĐIỂM TRONG CHAT ---
+_NUMBER = r"(\d+(?:[.,]\d+)?)(\s*ruoi)?"
+# Chỉ tự tính khi thí sinh nhờ tính điểm của chính mình; "tổng điểm xét tuyển" hay "điểm xét
+# tuyển" đơn thuần thường là câu hỏi điểm chuẩn.
+_INTENT_RE = re.compile(r"tinh (?:diem|giup|ho|dum|xem|thu)|duoc (?:bao nhieu|may) diem|duoc cong bao nhieu"
+                        r"|(?:diem xet tuyen|tong diem)(?: cua (?:em|minh|toi|con))? (?:la |se la |duoc )?bao nhieu")
+# Hỏi có đậu/đủ điểm chuẩn không -> cần điểm chuẩn, để Gemini trả lời
+_CUTOFF_RE = re.compile(r"diem chuan|trung tuyen|du diem|(?:co|de|se|kha nang|lieu) (?:dau|do)\b"
+                        r"|\b(?:dau|do) (?:khong|ko|nganh|vao)\b")
+_TOTAL_RE = re.compile(r"(?:tong diem(?: thi)?|dgnl|danh gia nang luc|duoc|dat)\s*(?:la|:|=)?\s*" + _NUMBER)
+_SUBJECT = r"\b(?:toan|ly|li|hoa|sinh|tin|anh|van)\b"
+# "toán 8, lý 9" và "8 điểm toán, 9 lý" (thứ tự hay gặp khi nói)
+_SUBJECT_RES = (
+    re.compile(_SUBJECT + r"\s*(?::|=)?\s*" + _NUMBER),
+    re.compile(_NUMBER + r"\s*(?:diem\s*)?(?:mon\s*)?" + _SUBJECT),
+)
+# Khu vực ưu tiên: "kv1", "kv2-nt", "khu vực 2 nông thôn", "ưu tiên khu vực 3"
+_REGION_RE = re.compile(r"\b(?:kv|khu vuc)\s*(1|2\s*-?\s*(?:nt|nong thon)|2|3)\b")
+# Chỉ đọc số điểm ưu tiên khi có đơn vị "điểm": "ưu tiên 0,75 điểm", "điểm ưu tiên là 0,5"
+_PRIORITY_POINTS_RE = re.compile(r"uu tien\s*(?:la|:|=)?\s*" + _NUMBER + r"\s*diem"
+                                 r"|diem uu tien\s*(?:la|:|=)?\s*" + _NUMBER)
+# Mô tả giải dừng ở dấu câu hoặc ở phần còn lại của câu ("... tính điểm giúp em", "... cho em hỏi")
+_AWARD_RE = re.compile(r"(giai [\w\s,/]+?|huy chuong \w+[\w\s/]*?|hc[vbd] [\w\s/]+?)"
+                       r"(?=[,.;?!]|$| va | nen | thi | duoc | em | minh | tong | uu tien | tinh (?:diem|giup|ho|dum|xem|thu)\b"
+                       r"| cho | giup | xem | hoi | la )")
+
+
+def _to_float(number, half):
+    value = float(number.replace(",", "."))
+    return value + 0.5 if half else value
+
+
+def parse_score_question(question):
+    # Trả về candidate dict nếu câu hỏi đủ thông tin để tính chắc chắn, ngược lại None
+    text = normalize(question)
+    if not _INTENT_RE.search(text) or _CUTOFF_RE.search(text):
+        return None
+
+    method = 3 if re.search(r"dgnl|danh gia nang luc|thang 1200", text) else 2
+    candidate = {"method": method}
+
+    subjects = max((pattern.findall(text) for pattern in _SUBJECT_RES), key=len) if method == 2 else []
+    total = _TOTAL_RE.search(text)
+    if len(subjects) == 3:
+        candidate["scores"] = [_to_float(n, h) for n, h in subjects]
+    elif subjects:
+        # Có điểm môn nhưng không đọc đủ 3 môn: "được 8" lúc này là điểm 1 môn, không phải tổng
+        return None
+    elif total:
+        candidate["total"] = _to_float(total.group(1), total.group(2))
+    else:
+        return None
+
+    award = _AWARD_RE.search(text)
+    if award:
+        candidate["award"] = award.group(1)
+    elif re.search(r"giai|huy chuong|diem cong", text):
+        # Có nhắc tới giải nhưng không đọc được chắc chắn -> để Gemini hỏi lại
+        return None
+
+    if re.search(r"doi tuong", text):
+        # Chưa có bảng ưu tiên đối tượng -> để Gemini trả lời thay vì bỏ qua phần điểm này
+        return None
+    region = _REGION_RE.search(text)
+    points = _PRIORITY_POINTS_RE.search(text)
+    if region:
+        level = region.group(1)
+        candidate["priority"] = "kv2-nt" if level[0] == "2" and len(level) > 1 else f"kv{level}"
+    elif points:
+        if points.group(1):
+            candidate["priority"] = _to_float(points.group(1), points.group(2))
+        else:
+            candidate["priority"] = _to_float(points.group(3), points.group(4))
+    elif re.search(r"uu tien", text):
+        # "ưu tiên 1" có thể là khu vực, đối tượng hay số điểm -> không đoán
+        return None
+    return candidate
+
+
+def format_score_reply(result):
+    method = result["method"]
+    unit = "thang 1200" if method == 3 else "thang 30"
+    lines = [f"Kết quả tính điểm xét tuyển phương thức {method} ({unit}):", ""]
+    lines.append(f"- Tổng điểm thi: **{result['total']:g}**")
+    if result["bonus_base"]:
+        if method == 3:
+            lines.append(f"- Điểm cộng cơ sở: {result['bonus_base']:g} (thang 30) -> **{result['bonus_base_scaled']:g}** (thang 1200)")
+        else:
+            lines.append(f"- Điểm cộng cơ sở: **{result['bonus_base']:g}**")
+        if result["reduced"]:
+            max_score, threshold, divisor, _ = METHODS[method]
+            lines.append(f"- Do tổng điểm thi của bạn là {result['total']:g} (>= {threshold:g} điểm), nên điểm cộng "
+                         f"được tính theo công thức điều chỉnh chứ không cộng trực tiếp: "
+                         f"[({max_score:g} - {result['total']:g}) / {divisor:g}] x {result['bonus_base_scaled']:g} "
+                         f"= **{result['bonus']:g}**")
+        else:
+            lines.append(f"- Tổng điểm thi dưới ngưỡng nên điểm cộng bằng điểm cộng cơ sở: **{result['bonus']:g}**")
+    if result["priority_reduced"]:
+        threshold, divisor = PRIORITY_RULES[method]
+        max_score = METHODS[method][0]
+        achieved = round(result["total"] + result["bonus"], 4)
+        lines.append(f"- Tổng điểm đạt được (điểm thi + điểm cộng) là {achieved:g} (>= {threshold:g} điểm), nên điểm ưu tiên "
+                     f"được giảm: [({max_score:g} - {achieved:g}) / {divisor:g}] x {result['priority_level']:g} "
+                     f"= **{result['priority']:g}**")
+    elif result["priority"]:
+        lines.append(f"- Điểm ưu tiên: **{result['priority']:g}**")
+    if result["capped"]:
+        lines.append(f"- Tổng vượt quá điểm tối đa nên được giới hạn ở mức tối đa.")
+    lines.append("")
+    lines.append(f"=> Điểm xét tuyển của bạn là **{result['final']:g}**.")
+    lines.append("")
+    lines.append(NOTE_2025)
+    return "\n".join(lines)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Các module của app nằm phẳng ở thư mục gốc repo; data/ cũng được đọc theo đường dẫn tương đối
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,68 @@
+import pytest
+from admission_tables import ADMISSION_YEAR, AdmissionTables, parse_lookup_question
+from answer_cache import find_programs
+
+
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    return AdmissionTables(cache_dir=str(tmp_path_factory.mktemp("kb_cache")))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Điểm chuẩn AI", ["ai"]),
+    ("điểm chuẩn ngành ai", ["ai"]),
+    ("học phí trí tuệ nhân tạo và APCS", ["ai", "apcs"]),
+    # "ai" viết thường là đại từ
+    ("điểm chuẩn do ai quyết định vậy?", []),
+    ("ai được xét tuyển thẳng", []),
+])
+def test_find_programs(text, expected):
+    assert find_programs(text) == expected
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Điểm chuẩn AI", {"kind": "scores", "programs": ["ai"], "year": None}),
+    ("Học phí APCS năm 3", {"kind": "tuition", "programs": ["apcs"], "study_year": 3}),
+    ("Điểm chuẩn AI năm 2024", {"kind": "scores", "programs": ["ai"], "year": 2024}),
+    ("điểm chuẩn AI năm ngoái", {"kind": "scores", "programs": ["ai"], "year": "năm ngoái"}),
+    ("Học phí APCS năm trước", {"kind": "tuition", "programs": ["apcs"], "year": "năm trước"}),
+    ("điểm chuẩn AI các năm trước", {"kind": "scores", "programs": ["ai"], "year": "các năm trước"}),
+    ("điểm chuẩn AI năm ngoái với năm 2024", None),
+    ("điểm chuẩn do ai quyết định vậy?", None),
+    ("So sánh điểm chuẩn AI và APCS", None),
+])
+def test_parse_lookup_question(question, expected):
+    lookup = parse_lookup_question(question)
+    if expected is None:
+        assert lookup is None
+    else:
+        assert {k: lookup[k] for k in expected} == expected
+
+
+def test_answer_uses_admission_year(tables):
+    reply = tables.answer("Điểm chuẩn AI")
+    assert f"năm {ADMISSION_YEAR}" in reply
+    assert "1092" in reply
+
+
+@pytest.mark.parametrize("question, year", [
+    ("Điểm chuẩn AI năm 2024", "năm 2024"),
+    ("học phí APCS năm 2023", "năm 2023"),
+    ("điểm chuẩn các ngành 2026", "năm 2026"),
+    ("điểm chuẩn AI năm ngoái", "năm ngoái"),
+    ("Điểm chuẩn APCS năm trước là bao nhiêu?", "năm trước"),
+    ("học phí ngành AI năm vừa rồi", "năm vừa rồi"),
+    ("điểm chuẩn AI mấy năm gần đây", "các năm trước"),
+])
+def test_answer_refuses_other_years(tables, question, year):
+    reply = tables.answer(question)
+    assert f"không hỗ trợ thông tin tuyển sinh {year}." in reply
+    assert "Lưu ý" not in reply
+
+
+def test_tables_are_cached_by_file(tmp_path):
+    first = AdmissionTables(cache_dir=str(tmp_path))
+    second = AdmissionTables(cache_dir=str(tmp_path))
+    assert (tmp_path / "tables_cache.json").exists()
+    for table in ("program", "cutoff_score", "tuition"):
+        assert second.query(f"SELECT * FROM {table}") == first.query(f"SELECT * FROM {table}")
@@ -0,0 +1,160 @@
+import types
+import datetime
+import pytest
+import context_cache
+from context_cache import ContextCacheManager, REFRESH_MARGIN, RETRY_AFTER
+from upstream import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+class FakeCaching:
+    # Giống caching.CachedContent: create() / list(), các cache đã tạo hết hạn theo ttl
+    def __init__(self, clock):
+        self.clock = clock
+        self.items = []
+        self.created = 0
+        self.error = None
+
+    def create(self, model, display_name, system_instruction, ttl):
+        if self.error is not None:
+            raise self.error
+        self.created += 1
+        expire = datetime.datetime.fromtimestamp(self.clock.now + ttl.total_seconds(), datetime.timezone.utc)
+        cached = types.SimpleNamespace(name=f"cachedContents/{self.created}", display_name=display_name,
+                                       system_instruction=system_instruction, expire_time=expire)
+        self.items.append(cached)
+        return cached
+
+    def list(self, page_size):
+        return list(self.items)
+
+
+class FakeModel:
+    def __init__(self, model_name, system_instruction=None, cached=None):
+        self.system_instruction = system_instruction
+        self.cached = cached
+
+    @classmethod
+    def from_cached_content(cls, cached):
+        return cls(None, cached=cached)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(context_cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def caching(clock):
+    return FakeCaching(clock)
+
+
+def make_manager(caching, **kwargs):
+    client = types.SimpleNamespace(caching=types.SimpleNamespace(CachedContent=caching), GenerativeModel=FakeModel)
+    kwargs.setdefault("spawn", lambda fn: fn())
+    return ContextCacheManager("gemini-test", client=client, enabled=True, ttl_seconds=3600, **kwargs)
+
+
+def test_creates_then_reuses(caching):
+    manager = make_manager(caching)
+    first = manager.get_model("chỉ thị")
+    second = manager.get_model("chỉ thị")
+    assert first.cached is caching.items[0]
+    assert second is first
+    assert caching.created == 1
+    assert manager.stats()["created"] == 1 and manager.stats()["active"]
+
+
+def test_reuses_cache_created_by_another_worker(caching):
+    make_manager(caching).get_model("chỉ thị")
+    model = make_manager(caching).get_model("chỉ thị")
+    assert model.cached is caching.items[0]
+    assert caching.created == 1
+
+
+def test_ttl_expiry_refreshes(caching, clock):
+    manager = make_manager(caching)
+    manager.get_model("chỉ thị")
+    clock.now += 3600 - REFRESH_MARGIN + 1
+    model = manager.get_model("chỉ thị")
+    assert caching.created == 2
+    assert model.cached is caching.items[1]
+    assert manager.stats()["expired"] == 1
+
+
+def test_new_knowledge_hash_invalidates(caching):
+    manager = make_manager(caching)
+    manager.get_model("dữ liệu cũ")
+    model = manager.get_model("dữ liệu mới")
+    assert caching.created == 2
+    assert model.cached.system_instruction == "dữ liệu mới"
+    assert manager.stats()["invalidated"] == 1
+
+
+def test_create_failure_falls_back_and_retries_later(caching, clock):
+    caching.error = RuntimeError("Cached content is too small")
+    manager = make_manager(caching)
+    model = manager.get_model("chỉ thị")
+    assert model.cached is None and model.system_instruction == "chỉ thị"
+    assert manager.stats()["errors"] == 1
+
+    caching.error = None
+    clock.now += RETRY_AFTER - 1
+    assert manager.get_model("chỉ thị").cached is None
+    assert caching.created == 0
+
+    clock.now += 2
+    assert manager.get_model("chỉ thị").cached is caching.items[0]
+    assert caching.created == 1
+
+
+def test_refresh_runs_in_background_and_serves_previous_model(caching, clock):
+    pending = []
+    manager = make_manager(caching, spawn=pending.append)
+    # Chưa có cache: trả system_instruction ngay, chỉ 1 lần tạo được khởi chạy
+    assert manager.get_model("chỉ thị").cached is None
+    assert manager.get_model("chỉ thị").cached is None
+    assert len(pending) == 1 and manager.stats()["refreshing"]
+    pending.pop()()
+    cached_model = manager.get_model("chỉ thị")
+    assert cached_model.cached is caching.items[0]
+
+    # Gần hết hạn: đang tạo lại thì vẫn dùng cache cũ còn hạn
+    clock.now += 3600 - REFRESH_MARGIN + 1
+    assert manager.get_model("chỉ thị") is cached_model
+    assert len(pending) == 1
+    pending.pop()()
+    assert manager.get_model("chỉ thị").cached is caching.items[1]
+
+
+def test_hung_refresh_is_abandoned_after_deadline(caching, clock):
+    pending = []
+    manager = make_manager(caching, spawn=pending.append, deadline=5)
+    manager.get_model("chỉ thị")
+    hung = pending.pop()
+    clock.now += 6
+    assert manager.get_model("chỉ thị").cached is None
+    stats = manager.stats()
+    assert stats["timeouts"] == 1 and not stats["refreshing"]
+    # Kết quả về muộn bị bỏ qua
+    hung()
+    assert manager.get_model("chỉ thị").cached is None
+    assert not pending
+
+
+def test_open_breaker_skips_caching_call(caching):
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=60)
+    breaker.record_failure()
+    manager = make_manager(caching, breaker=breaker)
+    assert manager.get_model("chỉ thị").cached is None
+    assert caching.created == 0
+    assert manager.stats()["errors"] == 1
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+from history import HistoryManager, condense_answer
+from scoring import NOTE_2025
+
+LONG_ANSWER = "\n".join(
+    ["Dạ, điểm chuẩn ngành Khoa học máy tính năm 2025 như sau:"]
+    + ["Ngành này đào tạo theo chương trình chuẩn, có nhiều môn học thú vị và cơ hội thực tập."] * 10
+    + ["- Điểm chuẩn THPT: **28.5**", "- Học phí: **35.000.000 đồng/năm**", "", NOTE_2025]
+)
+
+
+def message(id, role, content):
+    return SimpleNamespace(id=id, role=role, content=content, packed=None, format="md" if role == "bot" else "text")
+
+
+def test_condense_answer_keeps_facts_from_the_end():
+    digest = condense_answer(LONG_ANSWER)
+    assert digest.startswith("Dạ, điểm chuẩn ngành Khoa học máy tính")
+    assert "28.5" in digest and "35.000.000" in digest
+    assert "**" not in digest and "Lưu ý" not in digest
+    assert "thực tập" not in digest
+
+
+def test_condense_answer_respects_limit():
+    answer = "Mở đầu\n" + "\n".join(f"- Mục {i}: {i * 100} điểm" for i in range(100))
+    assert len(condense_answer(answer, limit=120)) <= 123
+
+
+def test_prepare_folds_old_turns_into_digest():
+    conv = SimpleNamespace(summary=None, summarized_until=0)
+    messages = []
+    for turn in range(4):
+        messages.append(message(turn * 2 + 1, "user", f"Câu hỏi số {turn}"))
+        messages.append(message(turn * 2 + 2, "bot", LONG_ANSWER))
+    window = HistoryManager(max_turns=2, token_budget=10000).prepare(conv, messages)
+
+    assert [role for role, _ in window.recent] == ["user", "bot", "user", "bot"]
+    assert window.recent[0][1] == "Câu hỏi số 2"
+    assert conv.summarized_until == 4
+    assert window.digest == conv.summary
+    assert "Người dùng hỏi: Câu hỏi số 0" in window.digest
+    assert "Câu hỏi số 2" not in window.digest
+    assert window.digest.count("28.5") == 2
@@ -0,0 +1,29 @@
+import pytest
+from flask import Flask
+from prometheus_client import REGISTRY
+import metrics
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    collectors = set(REGISTRY._collector_to_names)
+    metrics.init_app(app, {"test": lambda: {"calls": 1}})
+    yield app.test_client()
+    for collector in set(REGISTRY._collector_to_names) - collectors:
+        REGISTRY.unregister(collector)
+
+
+def test_metrics_denied_without_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", None)
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer None"}).status_code == 401
+
+
+def test_metrics_requires_matching_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    res = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert res.status_code == 200
+    assert b"fitbot_test_calls" in res.data
@@ -0,0 +1,125 @@
+import pytest
+from scoring import ScoreEngine, ScoringError, classify_award, parse_score_question
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return ScoreEngine()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("giải nhì học sinh giỏi tỉnh", ("hsg_tinh", ["nhi"])),
+    ("giai nhat tinh", ("hsg_tinh", ["nhat"])),
+    ("giải ba HSG cấp thành phố", ("hsg_tinh", ["ba"])),
+    ("giải nhất quốc gia môn tin", ("hsg_quoc_gia", ["nhat"])),
+    ("giải khuyến khích HSG quốc tế", ("hsg_quoc_gia", ["khuyen_khich"])),
+    # "tính" (động từ) bỏ dấu thành "tinh", không được hiểu là giải cấp tỉnh
+    ("giải nhất quốc gia môn tin tính điểm giúp em", ("hsg_quoc_gia", ["nhat"])),
+    ("giải tư KHKT quốc gia", ("khkt_quoc_gia", ["tu"])),
+    ("giải nhì khkt cấp tỉnh", ("khkt_tinh", ["nhi"])),
+    ("huy chương vàng olympic 30/4", ("olympic_30_4", ["vang"])),
+    ("giải vô địch ICPC", ("icpc", ["vo_dich"])),
+])
+def test_classify_award(text, expected):
+    assert classify_award(text) == expected
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("tổng điểm 29 giải nhất quốc gia môn tin tính điểm giúp em",
+     {"method": 2, "total": 29.0, "award": "giai nhat quoc gia mon tin"}),
+    ("Em được tổng điểm 27, giải nhì học sinh giỏi tỉnh, ưu tiên KV1, tính điểm xét tuyển giúp em",
+     {"method": 2, "total": 27.0, "award": "giai nhi hoc sinh gioi tinh", "priority": "kv1"}),
+    ("toán 9 lý 8 rưỡi hóa 9 thì điểm xét tuyển của em là bao nhiêu",
+     {"method": 2, "scores": [9.0, 8.5, 9.0]}),
+    ("Điểm ĐGNL 1000, giải nhất HSG quốc gia, ưu tiên KV2-NT, tính điểm giúp em",
+     {"method": 3, "total": 1000.0, "award": "giai nhat hsg quoc gia", "priority": "kv2-nt"}),
+    # Số đứng trước tên môn (thứ tự hay gặp khi nói)
+    ("em được 8 điểm toán, 9 lý, 9 hóa, tính điểm xét tuyển", {"method": 2, "scores": [8.0, 9.0, 9.0]}),
+    ("em đạt 9 toán 9 lý 9 hóa, tính điểm giúp em", {"method": 2, "scores": [9.0, 9.0, 9.0]}),
+    # Có điểm môn nhưng chưa đủ 3 môn -> không lấy "được 8" làm tổng
+    ("em được 8 điểm toán, 9 lý, tính điểm xét tuyển", None),
+    ("em đạt toán 9 lý 9, tính điểm giúp em", None),
+    # Khu vực ưu tiên viết đầy đủ
+    ("em được 25 điểm, ưu tiên khu vực 1, tính điểm giúp em", {"method": 2, "total": 25.0, "priority": "kv1"}),
+    ("em được 25 điểm, khu vực 3, tính điểm giúp em", {"method": 2, "total": 25.0, "priority": "kv3"}),
+    ("em được 25 điểm, khu vực 2 nông thôn, tính điểm giúp em", {"method": 2, "total": 25.0, "priority": "kv2-nt"}),
+    ("em được 25 điểm, ưu tiên khu vực 2, tính điểm giúp em", {"method": 2, "total": 25.0, "priority": "kv2"}),
+    # Số điểm ưu tiên chỉ được đọc khi có đơn vị "điểm"
+    ("em được 25, ưu tiên 0,5 điểm, tính điểm giúp em", {"method": 2, "total": 25.0, "priority": 0.5}),
+    ("em được 25, điểm ưu tiên là 0.75, tính điểm giúp em", {"method": 2, "total": 25.0, "priority": 0.75}),
+    ("em được 25, ưu tiên 1, tính điểm giúp em", None),
+    # Chưa hỗ trợ ưu tiên đối tượng -> để Gemini trả lời
+    ("em được 25 điểm, ưu tiên đối tượng 1, tính điểm giúp em", None),
+    ("em được 25 điểm, khu vực 1, đối tượng 6, tính điểm giúp em", None),
+    # Hỏi điểm chuẩn / có đậu không -> không tự tính
+    ("tổng điểm xét tuyển 3 môn là bao nhiêu thì đậu ngành AI? em được 27", None),
+    ("em được 27 điểm, tính xem có đậu ngành khoa học máy tính không", None),
+    ("điểm chuẩn ngành AI là bao nhiêu, em tổng điểm 27", None),
+    # Không có yêu cầu tính hoặc thiếu số liệu của thí sinh
+    ("tổng điểm 27", None),
+    ("cách tính điểm xét tuyển như thế nào", None),
+    # Có nhắc tới điểm cộng nhưng không đọc được giải -> để Gemini hỏi lại
+    ("em được 27 có điểm cộng, tính điểm giúp em", None),
+])
+def test_parse_score_question(question, expected):
+    assert parse_score_question(question) == expected
+
+
+@pytest.mark.parametrize("candidate, final", [
+    # Thang 30: điểm cộng cơ sở cộng thẳng khi tổng < 28
+    ({"method": 2, "total": 25, "award": "giải nhì HSG tỉnh"}, 26.5),
+    # Tổng >= 28: ĐC = [(30 - 29) / 2] * 2 = 1
+    ({"method": 2, "total": 29, "award": "giải nhất quốc gia môn tin"}, 30.0),
+    ({"method": 2, "scores": [9, 9.5, 9.5], "award": "giải ba tỉnh"}, 29.0),
+    # Tổng đạt được < 22,5: cộng đủ điểm ưu tiên
+    ({"method": 2, "total": 20, "priority": "kv1"}, 20.75),
+    # Tổng đạt được 27 + 1,5 = 28,5 >= 22,5: ĐUT = [(30 - 28,5) / 7,5] * 0,75 = 0,15
+    ({"method": 2, "total": 27, "award": "giải nhì học sinh giỏi tỉnh", "priority": "kv1"}, 28.65),
+    ({"method": 2, "total": 24, "priority": "kv2-nt"}, 24.4),
+    ({"method": 2, "total": 30, "award": "giải nhất quốc gia", "priority": "kv1"}, 30.0),
+    # Thang 1200: điểm cộng cơ sở x40, ngưỡng 1120 / chia 80
+    ({"method": 3, "total": 800, "award": "giải nhất HSG quốc gia"}, 880.0),
+    ({"method": 3, "total": 1160, "award": "giải nhất HSG quốc gia"}, 1200.0),
+    # Tổng đạt được < 900: cộng đủ ưu tiên KV1 = 30
+    ({"method": 3, "total": 800, "priority": "kv1"}, 830.0),
+    # Tổng đạt được 1000 + 80 = 1080 >= 900: ĐUT = [(1200 - 1080) / 300] * 30 = 12
+    ({"method": 3, "total": 1000, "award": "giải nhất HSG quốc gia", "priority": "kv1"}, 1092.0),
+])
+def test_score(engine, candidate, final):
+    assert engine.score(candidate)["final"] == pytest.approx(final)
+
+
+def test_parsed_region_is_not_raw_points(engine):
+    candidate = parse_score_question("em được 25 điểm, khu vực 3, tính điểm giúp em")
+    assert engine.score(candidate)["final"] == pytest.approx(25.0)
+
+
+def test_score_reports_priority_reduction(engine):
+    result = engine.score({"method": 2, "total": 27, "award": "giải nhì học sinh giỏi tỉnh", "priority": "kv1"})
+    assert result["bonus"] == pytest.approx(1.5)
+    assert result["priority_level"] == pytest.approx(0.75)
+    assert result["priority_reduced"]
+    assert result["priority"] == pytest.approx(0.15)
+
+
+@pytest.mark.parametrize("candidate", [
+    {"method": 1, "total": 25},
+    {"method": 2},
+    {"method": 2, "total": 31},
+    {"method": 2, "total": 25, "priority": "kv4"},
+    {"method": 2, "total": 25, "award": "giải nhất hội khỏe phù đổng"},
+    {"method": 2, "total": 25, "award": 5},
+    {"method": 2, "total": 25, "award": ["giải nhất quốc gia"]},
+    5,
+    "tổng điểm 25",
+    None,
+])
+def test_score_rejects_invalid(engine, candidate):
+    with pytest.raises(ScoringError):
+        engine.score(candidate)
+
+
+def test_score_many_reports_errors_per_item(engine):
+    results = engine.score_many([5, {"method": 2, "total": 25, "award": 5}, {"method": 2, "total": 25}])
+    assert [r["success"] for r in results] == [False, False, True]
+    assert results[2]["final"] == pytest.approx(25.0)
@@ -0,0 +1,205 @@
+import time
+import types
+import threading
+import pytest
+from google.api_core import exceptions as api_exceptions
+import upstream
+from upstream import CircuitBreaker, CircuitOpen, GeminiClient, SingleFlight, UpstreamLimiter
+from benchmarks.fake_gemini import FakeResponse
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class MaxRng:
+    # Full jitter luôn chọn khoảng chờ lớn nhất để kiểm tra được giới hạn backoff
+    def uniform(self, low, high):
+        return high
+
+
+class ScriptedSession:
+    # Mỗi lần send_message lấy 1 kết quả trong script: Exception thì raise, chuỗi thì trả lời.
+    # DeadlineExceeded được giả lập như SDK thật: tốn đúng timeout của lần gọi rồi mới lỗi.
+    def __init__(self, clock, script):
+        self.clock = clock
+        self.script = list(script)
+        self.timeouts = []
+
+    def send_message(self, content, stream=False, request_options=None):
+        timeout = request_options["timeout"]
+        self.timeouts.append(timeout)
+        outcome = self.script.pop(0) if self.script else "ok"
+        if isinstance(outcome, api_exceptions.DeadlineExceeded):
+            self.clock.sleep(timeout)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome, len(content))
+
+    @property
+    def calls(self):
+        return len(self.timeouts)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(upstream, "time", types.SimpleNamespace(monotonic=clock.monotonic,
+                                                                perf_counter=clock.monotonic))
+    return clock
+
+
+def make_client(clock, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=100, reset_after=30))
+    kwargs.setdefault("rng", MaxRng())
+    return GeminiClient(UpstreamLimiter(max_concurrent=4, max_queue=4), sleep=clock.sleep, **kwargs)
+
+
+def test_retries_transient_errors(clock):
+    sleeps = []
+    client = make_client(clock, max_retries=2, backoff=0.5, max_delay=4)
+    client.sleep = lambda s: (sleeps.append(s), clock.sleep(s))
+    session = ScriptedSession(clock, [api_exceptions.ServiceUnavailable("503"),
+                                      api_exceptions.TooManyRequests("429"), "xin chào"])
+    assert client.send(session, "câu hỏi").text == "xin chào"
+    assert session.calls == 3
+    # Backoff tăng gấp đôi: 0,5 rồi 1
+    assert sleeps == [0.5, 1.0]
+    assert client.metrics["retries"] == 2 and client.metrics["gave_up"] == 0
+    assert client.breaker.failures == 0
+
+
+def test_gives_up_after_max_retries(clock):
+    client = make_client(clock, max_retries=2, backoff=0.1)
+    session = ScriptedSession(clock, [api_exceptions.ServiceUnavailable("503")] * 5)
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        client.send(session, "câu hỏi")
+    assert session.calls == 3
+    assert client.metrics["gave_up"] == 1
+
+
+def test_does_not_retry_client_errors(clock):
+    client = make_client(clock, max_retries=2)
+    session = ScriptedSession(clock, [api_exceptions.InvalidArgument("400")])
+    with pytest.raises(api_exceptions.InvalidArgument):
+        client.send(session, "câu hỏi")
+    assert session.calls == 1
+    assert client.metrics["retries"] == 0
+    assert client.breaker.failures == 0
+
+
+def test_whole_turn_stays_within_deadline(clock):
+    client = make_client(clock, timeout=10, deadline=25, max_retries=10, backoff=1, max_delay=1)
+    session = ScriptedSession(clock, [api_exceptions.DeadlineExceeded("timeout")] * 10)
+    start = clock.now
+    with pytest.raises(api_exceptions.DeadlineExceeded):
+        client.send(session, "câu hỏi")
+    # Lần thứ 3 chỉ còn 3 giây trước deadline; sau đó không đủ thời gian để thử lại
+    assert session.timeouts == [10, 10, 3]
+    assert clock.now - start == pytest.approx(25)
+    assert client.metrics["gave_up"] == 1
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=30)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    clock.sleep(30)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    # Chỉ 1 lời gọi thử được đi qua
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    # Lời gọi thử lỗi -> mở lại
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.sleep(30)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    breaker.before_call()
+    assert breaker.metrics == {"opened": 2, "short_circuited": 2}
+
+
+def test_open_breaker_rejects_without_calling_gemini(clock):
+    client = make_client(clock, breaker=CircuitBreaker(failure_threshold=2, reset_after=30), max_retries=5)
+    failing = ScriptedSession(clock, [api_exceptions.ServiceUnavailable("503")] * 5)
+    with pytest.raises(CircuitOpen):
+        client.send(failing, "câu hỏi")
+    assert failing.calls == 2
+
+    session = ScriptedSession(clock, ["xin chào"])
+    with pytest.raises(CircuitOpen):
+        client.send(session, "câu hỏi")
+    assert session.calls == 0
+
+    clock.sleep(30)
+    assert client.send(session, "câu hỏi").text == "xin chào"
+    assert client.breaker.state == "closed"
+
+
+def run_concurrently(flights, fn, waiters):
+    # Người đầu tiên gọi fn; chờ tới khi các người sau đều đã nhập hàng rồi mới cho fn chạy xong
+    release = threading.Event()
+    outcomes = [None] * waiters
+
+    def leader_fn():
+        release.wait(5)
+        return fn()
+
+    def one(i):
+        try:
+            outcomes[i] = flights.run("key", leader_fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=one, args=(0,))]
+    threads[0].start()
+    while len(flights) == 0:
+        time.sleep(0.001)
+    for i in range(1, waiters):
+        threads.append(threading.Thread(target=one, args=(i,)))
+        threads[-1].start()
+    while flights.coalesced < waiters - 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    calls = []
+    outcomes = run_concurrently(flights, lambda: calls.append(1) or "kết quả", waiters=5)
+    assert len(calls) == 1
+    assert outcomes[0] == ("kết quả", False)
+    assert outcomes[1:] == [("kết quả", True)] * 4
+    assert len(flights) == 0
+
+
+def test_single_flight_shares_the_error():
+    flights = SingleFlight()
+    error = api_exceptions.ServiceUnavailable("503")
+
+    def fail():
+        raise error
+
+    outcomes = run_concurrently(flights, fail, waiters=4)
+    assert all(outcome is error for outcome in outcomes)
+    assert len(flights) == 0
+    # Lời gọi sau khi lỗi không dùng lại lỗi cũ
+    assert flights.run("key", lambda: "mới") == ("mới", False)
@@ -0,0 +1,38 @@
+import re
+import unicodedata
+
+# --- CHUẨN HÓA TIẾNG VIỆT ---
+# Dùng chung cho retrieval và các cache: bỏ dấu, chữ thường, tách âm tiết.
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Các từ xuất hiện ở hầu hết mọi câu hỏi, không giúp tìm kiếm
+STOPWORDS = {
+    "la", "va", "cua", "cho", "co", "khong", "nhung", "cac", "mot", "nhu", "the", "nao",
+    "thi", "o", "trong", "duoc", "voi", "ve", "em", "minh", "toi", "ban", "a", "ah", "oi",
+    "de", "den", "tu", "hay", "hoac", "nay", "do", "gi", "bao", "nhieu", "sao", "vay",
+    "ra", "vao", "khi", "neu", "cung", "da", "se", "dang", "rat", "nhe", "nha", "ko", "k",
+}
+
+
+def strip_diacritics(text):
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return text.replace("đ", "d").replace("Đ", "D")
+
+
+def normalize(text):
+    return strip_diacritics(unicodedata.normalize("NFC", text)).lower()
+
+
+def syllables(text):
+    return _WORD_RE.findall(normalize(text))
+
+
+def tokenize(text):
+    # Tiếng Việt là ngôn ngữ đơn lập: một từ thường gồm 2 âm tiết ("hoc phi", "diem chuan").
+    # Ngoài unigram, ghép thêm bigram để giữ được nghĩa của từ ghép.
+    sylls = syllables(text)
+    tokens = [s for s in sylls if s not in STOPWORDS]
+    tokens += [f"{a}_{b}" for a, b in zip(sylls, sylls[1:]) if not (a in STOPWORDS and b in STOPWORDS)]
+    return tokens
@@ -0,0 +1,250 @@
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+import requests
+from google.api_core import exceptions as api_exceptions
+from metrics import span, record_span, record_usage, UPSTREAM_RETRIES
+
+# --- GIỚI HẠN SỐ LỜI GỌI GEMINI ĐỒNG THỜI ---
+# Với worker gevent, một process phục vụ hàng trăm request cùng lúc. Semaphore này chặn
+# số lời gọi lên Gemini đang chạy; request vượt quá sẽ xếp hàng, quá lâu thì bị từ chối
+# thay vì treo worker. (threading được gevent monkey-patch nên không chặn cả process.)
+MAX_CONCURRENT = int(os.environ.get("UPSTREAM_MAX_CONCURRENT", 32))
+MAX_QUEUE = int(os.environ.get("UPSTREAM_MAX_QUEUE", 64))
+QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", 15))
+
+
+# --- GỌI GEMINI CÓ GIỚI HẠN THỜI GIAN, THỬ LẠI, NGẮT MẠCH VÀ GỘP CÂU HỎI TRÙNG ---
+# Mỗi lần gọi có timeout riêng (request_options), cả lượt (kể cả thử lại) không quá DEADLINE.
+# Lỗi tạm thời (503, 429, 500, hết giờ...) được thử lại sau khoảng chờ ngẫu nhiên (full jitter)
+# để các worker không cùng dội lại 1 lúc. Lỗi liên tiếp quá BREAKER_THRESHOLD lần thì ngắt mạch:
+# trong BREAKER_RESET giây mọi lời gọi bị từ chối ngay, sau đó cho 1 lời gọi thử để đóng mạch lại.
+CALL_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", 30))
+DEADLINE = float(os.environ.get("UPSTREAM_DEADLINE", 60))
+MAX_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", 2))
+RETRY_BACKOFF = float(os.environ.get("UPSTREAM_RETRY_BACKOFF", 0.5))
+RETRY_MAX_DELAY = float(os.environ.get("UPSTREAM_RETRY_MAX_DELAY", 4))
+BREAKER_THRESHOLD = int(os.environ.get("UPSTREAM_BREAKER_THRESHOLD", 5))
+BREAKER_RESET = float(os.environ.get("UPSTREAM_BREAKER_RESET", 30))
+# Còn ít hơn số giây này trước DEADLINE thì không thử lại nữa
+MIN_ATTEMPT_SECONDS = 1.0
+
+RETRYABLE_ERRORS = (
+    api_exceptions.ServiceUnavailable, api_exceptions.TooManyRequests, api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded, api_exceptions.GatewayTimeout, TimeoutError, ConnectionError,
+    requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+)
+
+
+class UpstreamBusy(Exception):
+    pass
+
+
+class CircuitOpen(UpstreamBusy):
+    pass
+
+
+class UpstreamLimiter:
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+
+    @contextmanager
+    def slot(self):
+        # Trả về số giây đã phải chờ trong hàng đợi
+        start = time.perf_counter()
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise UpstreamBusy("Hàng đợi gọi Gemini đã đầy")
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise UpstreamBusy(f"Chờ quá {self.queue_timeout}s để gọi Gemini")
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield time.perf_counter() - start
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "waiting": self.waiting, "rejected": self.rejected}
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+        self.metrics = {"opened": 0, "short_circuited": 0}
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            if (self.state == "open" and now - self._opened_at >= self.reset_after) or \
+                    (self.state == "half_open" and now - self._probe_at >= self.reset_after):
+                # Hết thời gian ngắt: cho đúng 1 lời gọi thử, các lời gọi khác vẫn bị từ chối.
+                # Lời gọi thử không báo kết quả (lỗi khác) thì sau reset_after cho thử lần nữa.
+                self.state = "half_open"
+                self._probe_at = now
+                return
+            self.metrics["short_circuited"] += 1
+        raise CircuitOpen("Gemini đang lỗi liên tục, tạm ngừng gọi")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.metrics["opened"] += 1
+                print(f">>> Ngắt mạch Gemini trong {self.reset_after:g}s sau {self.failures} lỗi liên tiếp")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, breaker_open=self.state != "closed", consecutive_failures=self.failures)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Các lời gọi cùng key đang chạy dùng chung 1 kết quả (hoặc cùng 1 lỗi)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.coalesced = 0
+
+    def run(self, key, fn):
+        # Trả về (kết quả, có phải dùng chung kết quả của lời gọi khác không)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class GeminiClient:
+    # Bọc chat_session.send_message: giữ slot của limiter, timeout, thử lại, ngắt mạch, gộp câu hỏi trùng
+    def __init__(self, limiter, breaker=None, timeout=CALL_TIMEOUT, deadline=DEADLINE, max_retries=MAX_RETRIES,
+                 backoff=RETRY_BACKOFF, max_delay=RETRY_MAX_DELAY, rng=None, sleep=time.sleep):
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.flights = SingleFlight()
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+        self.sleep = sleep
+        self.metrics = {"calls": 0, "retries": 0, "gave_up": 0}
+
+    def send(self, chat_session, content, key=None):
+        # key: các request cùng key đang chờ chỉ tạo 1 lời gọi lên Gemini (câu hỏi giống hệt nhau)
+        if key is None:
+            return self._send(chat_session, content)
+        start = time.perf_counter()
+        response, shared = self.flights.run(key, lambda: self._send(chat_session, content))
+        if shared:
+            record_span("coalesced", time.perf_counter() - start)
+        return response
+
+    def _send(self, chat_session, content):
+        with self.limiter.slot() as waited:
+            record_span("queue", waited)
+            with span("gemini"):
+                response = self._call(chat_session, content, stream=False)
+        record_usage(response)
+        return response
+
+    @contextmanager
+    def stream(self, chat_session, content):
+        # Giữ slot suốt thời gian stream vì kết nối tới Gemini vẫn mở.
+        # Chỉ thử lại khi chưa nhận được đoạn nào; lỗi giữa chừng trả thẳng cho caller.
+        with self.limiter.slot() as waited:
+            record_span("queue", waited)
+            with span("gemini"):
+                response = self._call(chat_session, content, stream=True)
+            yield response
+
+    def _call(self, chat_session, content, stream):
+        self.metrics["calls"] += 1
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            timeout = max(0.1, min(self.timeout, deadline - time.monotonic()))
+            try:
+                response = chat_session.send_message(content, stream=stream, request_options={"timeout": timeout})
+            except RETRYABLE_ERRORS as e:
+                self.breaker.record_failure()
+                delay = self.rng.uniform(0, min(self.max_delay, self.backoff * 2 ** attempt))
+                attempt += 1
+                if attempt > self.max_retries or time.monotonic() + delay > deadline - MIN_ATTEMPT_SECONDS:
+                    self.metrics["gave_up"] += 1
+                    raise
+                self.metrics["retries"] += 1
+                UPSTREAM_RETRIES.inc()
+                print(f">>> Gemini lỗi tạm thời ({type(e).__name__}), thử lại lần {attempt} sau {delay:.2f}s")
+                self.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return response
+
+    def stats(self):
+        return dict(self.metrics, **self.breaker.stats(), coalesced=self.flights.coalesced, in_flight_keys=len(self.flights))